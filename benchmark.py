@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import multiprocessing
+import argparse
+import platform
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from chat_plotter import ChatStatsPlotter, BAD_WORDS
+from chat_stat import ChatStats
+from instrumentation import Instrumentation
+from synthetic_chat import generate_chat
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_FOLDER = 'whatsapp_stat/files/benchmarks'
+DEFAULT_SIZES = [10_000, 100_000]
+PLOT_METHODS = ['plot_next_message_distribution', 'plot_word_distribution', 'plot_top_30_dates', 'plot_hour_distribution',
+                'plot_month_distribution', 'plot_year_distribution', 'plot_date_distribution', 'plot_name_distribution',
+                'plot_top_25_words_by_person', 'plot_top_25_words_overall', 'plot_top_25_two_word_phrases',
+                'plot_top_25_three_word_phrases', 'plot_reply_latency', 'plot_session_distribution']
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or ``None`` where it can't be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_case(messages, workdir, senders=8, workers=1, plots=False, seed=0):
+    """Generate a chat of ``messages`` messages in ``workdir`` and time every stage on it.
+
+    Runs inside its own process so the peak memory belongs to this case alone. The working
+    directory is switched to ``workdir`` so the stats store, name file, checkpoint and plots
+    all land there instead of in the real ``whatsapp_stat`` folder.
+    """
+    os.chdir(workdir)
+    os.makedirs('whatsapp_stat/files', exist_ok=True)
+    filepath = f'whatsapp_stat/files/chat_bench_{messages}.txt'
+
+    start = time.perf_counter()
+    generate_chat(filepath, messages=messages, senders=senders, seed=seed)
+    generate_seconds = time.perf_counter() - start
+
+    run = Instrumentation(f'chat_bench_{messages}')
+    chat_data = ChatStats(filepath, workers=workers, unknown_senders='keep', instrumentation=run)
+    if plots:
+        plotter = ChatStatsPlotter(chat_data, use_cache=False)
+        for method in PLOT_METHODS:
+            getattr(plotter, method)(*((BAD_WORDS,) if method == 'plot_word_distribution' else ()))
+
+    # Word and n-gram counting (process_message) is part of the parse, in the parallel path
+    # it happens in the workers and is not timed, merge_chunks is the serial merge of their results
+    stages = {'parse': run.seconds['load_data'] - run.seconds['save_checkpoint']}
+    timed_stages = ['process_message', 'merge_chunks', 'save_history', 'save_checkpoint'] + PLOT_METHODS
+    stages.update((stage, run.seconds[stage]) for stage in timed_stages if stage in run.seconds)
+
+    # Taken before the resume, which runs in its own process and reports its own peak
+    peak_rss = peak_rss_mb()
+    with open(filepath, 'ab') as file:
+        file.write(last_line(filepath))
+    # A spawned process starts without the memory of this one
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        stages['resume'], resume_peak_rss = executor.submit(run_resume, filepath, workers).result()
+
+    return {
+        'messages': chat_data.message_count,
+        'file_mb': round(os.path.getsize(filepath) / (1024 * 1024), 2),
+        'workers': workers,
+        'generate_seconds': round(generate_seconds, 3),
+        'messages_per_second': round(chat_data.message_count / stages['parse']),
+        'peak_rss_mb': peak_rss,
+        'resume_peak_rss_mb': resume_peak_rss,
+        'stages': {stage: round(seconds, 4) for stage, seconds in stages.items()},
+        'counters': dict(run.counters),
+    }
+
+
+def run_resume(filepath, workers):
+    """Parse the chat again from its checkpoint after a message was appended, return the seconds and peak memory."""
+    start = time.perf_counter()
+    ChatStats(filepath, workers=workers, unknown_senders='keep')
+    return time.perf_counter() - start, peak_rss_mb()
+
+
+def last_line(filepath, block_size=4096):
+    """Return the last line of ``filepath``, read from the end of the file."""
+    with open(filepath, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        tail = b''
+        while position > 0 and b'\n' not in tail.rstrip(b'\n'):
+            step = min(block_size, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+    return tail.rstrip(b'\n').rsplit(b'\n', 1)[-1] + b'\n'
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, senders=8, workers=(1,), plots=False, seed=0):
+    """Run one case per size and worker count, each in a fresh process and a scratch folder, and return the report.
+
+    With several worker counts, the parse of every size is compared against the first count.
+    """
+    cases = []
+    for messages in sizes:
+        baseline = None
+        for worker_count in workers:
+            workdir = tempfile.mkdtemp(prefix='chat_bench_')
+            try:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    case = executor.submit(run_case, messages, workdir, senders, worker_count, plots, seed).result()
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            print(f"{messages:>10} messages, {worker_count} workers: {case['messages_per_second']:>8} msg/s, "
+                  f"peak {case['peak_rss_mb']} MB, " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in case['stages'].items()))
+            if baseline is None:
+                baseline = case
+            else:
+                speedup = baseline['stages']['parse'] / case['stages']['parse']
+                print(f"{'':>10} parse {speedup:.2f}x as fast as with {baseline['workers']} workers")
+            cases.append(case)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'cases': cases,
+    }
+
+
+def compare(report, baseline):
+    """Print how each stage of ``report`` changed against a saved ``baseline`` report."""
+    baseline_cases = {(case['messages'], case['workers']): case for case in baseline['cases']}
+    for case in report['cases']:
+        old = baseline_cases.get((case['messages'], case['workers']))
+        if old is None:
+            print(f"{case['messages']} messages: not in the baseline")
+            continue
+        print(f"{case['messages']} messages: {old['messages_per_second']} -> {case['messages_per_second']} msg/s, "
+              f"peak {old['peak_rss_mb']} -> {case['peak_rss_mb']} MB")
+        for stage, seconds in case['stages'].items():
+            if stage in old['stages'] and old['stages'][stage]:
+                print(f"    {stage}: {old['stages'][stage]:.3f}s -> {seconds:.3f}s ({seconds / old['stages'][stage]:.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark parsing and plotting on synthetic chats.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="message counts to generate")
+    parser.add_argument('--senders', type=int, default=8)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help="parser worker processes, several to compare them")
+    parser.add_argument('--plots', action='store_true', help="also time every plot_* method")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='NAME', help=f"save the report as {BENCHMARK_FOLDER}/NAME.json")
+    parser.add_argument('--compare', metavar='PATH', help="compare against a saved report")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, senders=args.senders, workers=args.workers, plots=args.plots, seed=args.seed)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare(report, json.load(file))
+    if args.save:
+        os.makedirs(BENCHMARK_FOLDER, exist_ok=True)
+        path = os.path.join(BENCHMARK_FOLDER, f'{args.save}.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+        print(f"Saved {path}")
@@ -0,0 +1,367 @@
+import os
+import json
+import zlib
+import heapq
+from collections import Counter, defaultdict
+from datetime import date as date_type
+
+import pandas as pd
+
+from leaderboard import Leaderboard
+from lexicon import Lexicon, compile_lexicons, lexicon_signature
+from ngram_counter import NGramCounter, MisraGriesCounter, TokenVocabulary
+from sessions import SESSION_GAP_MINUTES, SessionTracker
+from tokenizer import Tokenizer
+
+AGGREGATE_VERSION = 2
+MEDIA = ["<המדיה לא נכללה>"]
+# The statistics that can be counted on their own: the hour, month, year and date counts, the
+# counts per sender, who wrote after whom, reply times and sessions, the word counts, the
+# lexicon counts and the two and three word phrases. The last three split the text into words.
+COLLECTORS = ('time', 'names', 'next_message', 'sessions', 'words', 'lexicons', 'phrases')
+WORD_COLLECTORS = frozenset({'words', 'lexicons', 'phrases'})
+
+
+class ChatAggregate:
+    """The statistics of one or more chats, without anything tied to parsing a file.
+
+    Aggregates of different chats, or of parts of one chat exported from several phones, can be
+    combined with ``merge`` or ``+`` instead of re-parsing the text. Every statistic is a sum of
+    counts, so the order in which aggregates are combined does not change them. With an
+    ``ngram_capacity`` the phrase counts stay within the error bound of the approximate counter
+    whatever the order, but the exact counts may differ slightly.
+
+    ``ChatStats`` is an aggregate too, so a parsed chat can be merged, saved and plotted as is::
+
+        year = ChatAggregate.load('family.agg') + ChatStats('whatsapp_stat/files/chat_yavne.txt')
+        ChatStatsPlotter(year).plot_all()
+
+    ``collectors`` names the statistics of ``COLLECTORS`` that are counted, all of them by default.
+    The others stay empty and cost nothing per message. ``tokenizer`` splits the messages into
+    words, a default ``Tokenizer`` if not given.
+
+    The most common words, phrases and dates are kept in leaderboards while they are counted and
+    saved with the rest of the statistics, so ``top_words``, ``top_words_overall``, ``top_dates``
+    and ``most_common`` of the phrase counters don't sort the whole vocabulary.
+    """
+    def __init__(self, chat_name='combined', ngram_capacity=None, lexicons=(), session_gap=SESSION_GAP_MINUTES, collectors=None,
+                 tokenizer=None):
+        self.chat_name = chat_name
+        # With a capacity the phrase counts are approximate and only that many phrases are kept
+        self.ngram_capacity = ngram_capacity
+        self.session_gap = session_gap
+        self.tokenizer = tokenizer or Tokenizer()
+        self._set_collectors(collectors)
+        self._set_lexicons(lexicons)
+        self._reset_stats()
+
+    def _set_collectors(self, collectors):
+        collectors = frozenset(COLLECTORS if collectors is None else collectors)
+        unknown = collectors - set(COLLECTORS)
+        if unknown:
+            raise ValueError(f"Unknown statistics {', '.join(sorted(unknown))}, expected some of {', '.join(COLLECTORS)}")
+        self.collectors = collectors
+        # One flag per collector, checked for every message
+        self._count_time = 'time' in collectors
+        self._count_names = 'names' in collectors
+        self._count_next_message = 'next_message' in collectors
+        self._count_sessions = 'sessions' in collectors
+        self._count_words = 'words' in collectors
+        self._count_lexicons = 'lexicons' in collectors
+        self._count_phrases = 'phrases' in collectors
+        self._tokenize = bool(collectors & WORD_COLLECTORS)
+
+    def _set_lexicons(self, lexicons):
+        # Words of the lexicons are counted per group and person while the messages are parsed
+        self.lexicons = list(lexicons)
+        self._lexicon_matcher = compile_lexicons(self.lexicons, self.tokenizer.normalize)
+
+    def _reset_stats(self):
+        self.message_count = 0
+        self.hour_dict = defaultdict(int)
+        self.month_dict = defaultdict(int)
+        self.year_dict = defaultdict(int)
+        self.date_dict = defaultdict(int)
+        self.name_dict = defaultdict(int)
+        self.person_word_count_dict = defaultdict(lambda: defaultdict(int))
+        # The same word counts indexed by person, so one person's words can be ranked on their own
+        self.person_word_index = defaultdict(Counter)
+        self.person_next_message = defaultdict(lambda: defaultdict(int))
+        # The most common words overall and per person and the busiest days, days keyed by their
+        # negated ordinal so ties go to the earlier day
+        self.word_leaderboard = Leaderboard()
+        self.person_word_leaderboards = defaultdict(Leaderboard)
+        self.date_leaderboard = Leaderboard()
+        self.sessions = SessionTracker(self.session_gap)
+        # lexicon name -> group -> person -> count, with the groups in the order of the lexicon
+        self.lexicon_counts = {lexicon.name: {group[0]: defaultdict(int) for group in lexicon.groups} for lexicon in self.lexicons}
+        self.vocabulary = TokenVocabulary()
+        if self.ngram_capacity:
+            self.two_word_dict = MisraGriesCounter(2, self.vocabulary, self.ngram_capacity)
+            self.three_word_dict = MisraGriesCounter(3, self.vocabulary, self.ngram_capacity)
+        else:
+            self.two_word_dict = NGramCounter(2, self.vocabulary)
+            self.three_word_dict = NGramCounter(3, self.vocabulary)
+
+    def _process_message(self,person,message):
+        self._process_messages((person,), (message,))
+
+    def _process_messages(self, persons, messages):
+        """Count the words, lexicon words and phrases of many messages at once.
+
+        The texts are tokenized in one batch, and the words of each person are summed with a
+        ``Counter`` before they are added, so a word used many times in the batch is added once.
+        Stop words are left out of the word counts only.
+        """
+        if not self._tokenize:
+            return
+        senders, texts = [], []
+        for person, message in zip(persons, messages):
+            if message in MEDIA:
+                if self._count_words:
+                    self.person_word_count_dict["שליחה של מדיה"][person] += 1
+                    self.person_word_count_dict["מדיה"]["count"] += 1
+                    self.person_word_index[person]["שליחה של מדיה"] += 1
+                    # The media count is kept under מדיה, a stop word, so it is not ranked with the words
+                    self._rank_word("שליחה של מדיה", (person,))
+                continue
+            senders.append(person)
+            texts.append(message)
+
+        person_words = defaultdict(list)
+        for person, words in zip(senders, self.tokenizer.tokenize_many(texts)):
+            person_words[person] += words
+            # Update the two and three word phrase statistics over the interned word ids
+            if self._count_phrases and len(words) > 1:
+                ids = self.vocabulary.intern_all(words)
+                self.two_word_dict.add(ids, person)
+                self.three_word_dict.add(ids, person)
+
+        word_leaderboard = self.word_leaderboard
+        for person, words in person_words.items():
+            counts = Counter(words)
+            if self._count_lexicons:
+                for word in self._lexicon_matcher.keys() & counts.keys():
+                    for lexicon, group in self._lexicon_matcher[word]:
+                        self.lexicon_counts[lexicon][group][person] += counts[word]
+            if self._count_words:
+                for word in self.tokenizer.stop_words & counts.keys():
+                    del counts[word]
+                self.person_word_index[person].update(counts)
+                person_leaderboard = self.person_word_leaderboards[person]
+                for word, count in counts.items():
+                    word_counts = self.person_word_count_dict[word]
+                    person_count = word_counts[person] = word_counts[person] + count
+                    total = word_counts['count'] = word_counts['count'] + count
+                    if person_count >= person_leaderboard.floor:
+                        person_leaderboard.offer(word, person_count)
+                    if total >= word_leaderboard.floor:
+                        word_leaderboard.offer(word, total)
+
+    def _rank_word(self, word, persons):
+        """Offer the counts of ``word``, overall and of each of ``persons``, to the leaderboards."""
+        word_counts = self.person_word_count_dict[word]
+        if 'count' in word_counts and word not in self.tokenizer.stop_words and word_counts['count'] >= self.word_leaderboard.floor:
+            self.word_leaderboard.offer(word, word_counts['count'])
+        for person in persons:
+            if person != 'count':
+                leaderboard = self.person_word_leaderboards[person]
+                if word_counts[person] >= leaderboard.floor:
+                    leaderboard.offer(word, word_counts[person])
+
+    def _rank_date(self, date):
+        count = self.date_dict[date]
+        if count >= self.date_leaderboard.floor:
+            self.date_leaderboard.offer(-date.toordinal(), count)
+
+    def export_state(self, arrays=False):
+        """Return the statistics as plain JSON-friendly dicts.
+
+        With ``arrays=True`` the phrase counts are numpy arrays of word ids instead, with the
+        vocabulary alongside, which is much faster to save and to merge than phrase strings.
+        """
+        state = {
+            "hour_dict": dict(self.hour_dict),
+            "month_dict": dict(self.month_dict),
+            "year_dict": dict(self.year_dict),
+            "date_dict": {date.isoformat(): count for date, count in self.date_dict.items()},
+            "name_dict": dict(self.name_dict),
+            "person_word_count_dict": {word: dict(counts) for word, counts in self.person_word_count_dict.items()},
+            "person_next_message": {person: dict(counts) for person, counts in self.person_next_message.items()},
+            "lexicon_counts": {lexicon: {group: dict(counts) for group, counts in groups.items()}
+                               for lexicon, groups in self.lexicon_counts.items()},
+            "sessions": self.sessions.export_state(),
+            "leaderboards": {
+                "words": self.word_leaderboard.export_state(),
+                "person_words": {person: leaderboard.export_state() for person, leaderboard in self.person_word_leaderboards.items()},
+                "dates": self.date_leaderboard.export_state(),
+            },
+        }
+        if arrays:
+            state["vocabulary"] = list(self.vocabulary.words)
+            state["two_word_dict"] = self.two_word_dict.export_arrays()
+            state["three_word_dict"] = self.three_word_dict.export_arrays()
+        else:
+            state["two_word_dict"] = self.two_word_dict.export_state()
+            state["three_word_dict"] = self.three_word_dict.export_state()
+        return state
+
+    def merge_state(self, stats):
+        """Add statistics exported by ``export_state``, with or without ``arrays``, to the current ones.
+
+        Into empty statistics the saved leaderboards are taken as they are, otherwise the merged
+        words and dates are offered to the leaderboards with their new counts.
+        """
+        leaderboards = stats.get("leaderboards")
+        load_dates = leaderboards is not None and not self.date_dict
+        load_words = leaderboards is not None and not self.person_word_count_dict
+        for key, count in stats["hour_dict"].items():
+            self.hour_dict[int(key)] += count
+        for key, count in stats["month_dict"].items():
+            self.month_dict[int(key)] += count
+        for key, count in stats["year_dict"].items():
+            self.year_dict[int(key)] += count
+        for key, count in stats["date_dict"].items():
+            date = date_type.fromisoformat(key)
+            self.date_dict[date] += count
+            if not load_dates:
+                self._rank_date(date)
+        for key, count in stats["name_dict"].items():
+            self.name_dict[key] += count
+        if "vocabulary" in stats:
+            word_ids = self.vocabulary.merge_words(stats["vocabulary"])
+            self.two_word_dict.merge_arrays(stats["two_word_dict"], word_ids)
+            self.three_word_dict.merge_arrays(stats["three_word_dict"], word_ids)
+        else:
+            self.two_word_dict.merge_state(stats["two_word_dict"])
+            self.three_word_dict.merge_state(stats["three_word_dict"])
+        for person, counts in stats["person_next_message"].items():
+            for next_person, count in counts.items():
+                self.person_next_message[person][next_person] += count
+        for word, counts in stats["person_word_count_dict"].items():
+            word_counts = self.person_word_count_dict[word]
+            for person, count in counts.items():
+                word_counts[person] += count
+                if person != 'count':
+                    self.person_word_index[person][word] += count
+            if not load_words:
+                self._rank_word(word, counts)
+        if load_dates:
+            self.date_leaderboard = Leaderboard.from_state(leaderboards["dates"])
+        if load_words:
+            self.word_leaderboard = Leaderboard.from_state(leaderboards["words"])
+            for person, state in leaderboards["person_words"].items():
+                self.person_word_leaderboards[person] = Leaderboard.from_state(state)
+        for lexicon, groups in stats.get("lexicon_counts", {}).items():
+            lexicon_groups = self.lexicon_counts.setdefault(lexicon, {})
+            for group, counts in groups.items():
+                group_counts = lexicon_groups.setdefault(group, defaultdict(int))
+                for person, count in counts.items():
+                    group_counts[person] += count
+        if "sessions" in stats:
+            self.sessions.merge_state(stats["sessions"])
+
+    def merge(self, other):
+        """Add the statistics of another aggregate to this one and return it.
+
+        Only the statistics both of them counted stay counted. Aggregates whose words were split
+        by a different tokenizer or matched against different lexicons can't be merged.
+        """
+        if other.ngram_capacity != self.ngram_capacity:
+            raise ValueError(f"Can't merge phrase counts with capacity {other.ngram_capacity} into capacity {self.ngram_capacity}")
+        if other.tokenizer.signature() != self.tokenizer.signature():
+            raise ValueError(f"Can't merge {other.chat_name} into {self.chat_name}, their words were split with different tokenizer settings")
+        if lexicon_signature(other.lexicons) != lexicon_signature(self.lexicons):
+            raise ValueError(f"Can't merge {other.chat_name} into {self.chat_name}, their lexicon counts are of different lexicons")
+        self.merge_state(other.export_state())
+        self.message_count += other.message_count
+        self._set_collectors(self.collectors & other.collectors)
+        return self
+
+    def collect(self, collectors):
+        """Make sure the statistics of ``collectors`` are counted.
+
+        An aggregate has no messages to count them from, so this only checks it. ``ChatStats``
+        parses its file again for the missing ones.
+        """
+        missing = set(collectors) - self.collectors
+        if missing:
+            raise ValueError(f"{self.chat_name} has no {', '.join(sorted(missing))} statistics")
+        return self
+
+    def __add__(self, other):
+        if not isinstance(other, ChatAggregate):
+            return NotImplemented
+        names = sorted(set(self.chat_name.split('+')) | set(other.chat_name.split('+')))
+        return ChatAggregate('+'.join(names), self.ngram_capacity, self.lexicons, self.session_gap,
+                             tokenizer=self.tokenizer).merge(self).merge(other)
+
+    def __iadd__(self, other):
+        if not isinstance(other, ChatAggregate):
+            return NotImplemented
+        return self.merge(other)
+
+    def to_bytes(self):
+        """Serialize the aggregate into a compressed blob that ``from_bytes`` reads back."""
+        state = {
+            "version": AGGREGATE_VERSION,
+            "chat_name": self.chat_name,
+            "ngram_capacity": self.ngram_capacity,
+            "session_gap": self.session_gap,
+            "collectors": sorted(self.collectors),
+            "tokenizer": self.tokenizer.signature(),
+            "lexicons": [[lexicon.name, [list(group) for group in lexicon.groups], lexicon.prefixes] for lexicon in self.lexicons],
+            "message_count": self.message_count,
+            "stats": self.export_state(),
+        }
+        return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = json.loads(zlib.decompress(data).decode('utf-8'))
+        if state.get("version") != AGGREGATE_VERSION:
+            raise ValueError(f"Unsupported aggregate version {state.get('version')}")
+        stop_words, final_letters, form = state["tokenizer"]
+        aggregate = ChatAggregate(state["chat_name"], state["ngram_capacity"], [Lexicon(*lexicon) for lexicon in state["lexicons"]],
+                                  state["session_gap"], state["collectors"], Tokenizer(stop_words, final_letters, form))
+        aggregate.merge_state(state["stats"])
+        aggregate.message_count = state["message_count"]
+        return aggregate
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as file:
+            file.write(self.to_bytes())
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+    def top_words(self, person, n=25):
+        """Return the ``n`` words ``person`` used most, as ``(word, count)`` pairs."""
+        if person not in self.person_word_index:
+            return []
+        leaderboard = self.person_word_leaderboards.get(person)
+        if leaderboard is not None and n <= leaderboard.size:
+            return leaderboard.ranked(n)
+        return self.person_word_index[person].most_common(n)
+
+    def top_words_overall(self, n=25):
+        """Return the ``n`` words used most in the chat, as ``(word, count)`` pairs."""
+        if n <= self.word_leaderboard.size:
+            return self.word_leaderboard.ranked(n)
+        stop_words = self.tokenizer.stop_words
+        return heapq.nlargest(n, ((word, counts['count']) for word, counts in self.person_word_count_dict.items()
+                                  if 'count' in counts and word not in stop_words), key=lambda item: item[1])
+
+    def top_dates(self, n=30):
+        """Return the ``n`` days with the most messages, as ``(date, count)`` pairs."""
+        if n <= self.date_leaderboard.size:
+            return [(date_type.fromordinal(-day), count) for day, count in self.date_leaderboard.ranked(n)]
+        return heapq.nlargest(n, self.date_dict.items(), key=lambda item: item[1])
+
+    def distribution_frame(self, name, column):
+        """Return the ``name`` distribution as a DataFrame with ``column`` and ``Count`` columns."""
+        counts = getattr(self, f"{name}_dict")
+        return pd.DataFrame({column: list(counts.keys()), 'Count': list(counts.values())})
@@ -1,28 +1,52 @@
 import os
+import heapq
 from collections import Counter
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
+from dashboard import write_dashboard
+from instrumentation import NULL_INSTRUMENTATION
+from lexicon import BAD_WORDS, GOOD_WORDS
+from plot_renderer import PlotRenderer
+from sessions import LOG_BUCKETS, bucket_label, log_bucket, median_bucket
 
 WIDTH=1400
 HEIGHT=900
 TICK_SIZE = 16
 TITLE_SIZE = 22
 AXIS_SIZE = 20
-BAD_WORDS=[
-    ("זונה","הזונה","זונות","הזונות","בנזונה","זנות"),
-    ("סתום","טיפש","אידיוט","מפגר","דבע"),
-    ("זין","זיןן"),
-    ("מזדיין","מדיינת","זדיין","זיין","זיינתי","זיינו","הזדיינתי","תזדיינו","להזדיין"),
-    ("שרמוטה","שרמוטות"),]
-GOOD_WORDS = [
-    ("אוהב","מאוהב","אהבתי","אהבה","לאהוב","אהבה"),
-    ("תודה","תודות","להודות","מודה"),
-    ("שמח","שמחתי","לשמוח","לחייך","חיוך"),
-    ("טוב","טובה","לטובה","טובב","יופי"),
+# The plots of plot_all in order: the name of the method building their figures, their dashboard
+# section and the statistics they are built from
+PLOTS = [
+    ('next_message_distribution', "Next message", ('next_message',)),
+    ('reply_latency', "Reply times", ('sessions',)),
+    ('session_distribution', "Sessions", ('sessions',)),
+    ('lexicon_distributions', "Word groups", ('lexicons',)),
+    ('name_distribution', "Persons", ('names',)),
+    ('year_distribution', "Years", ('time',)),
+    ('month_distribution', "Months", ('time',)),
+    ('date_distribution', "Dates", ('time',)),
+    ('hour_distribution', "Hours", ('time',)),
+    ('top_25_words_by_person', "Top words by person", ('words',)),
+    ('top_25_words_overall', "Top words", ('words',)),
+    ('top_30_dates', "Top dates", ('time',)),
+    ('top_25_three_word_phrases', "Three word phrases", ('phrases',)),
+    ('top_25_two_word_phrases', "Two word phrases", ('phrases',)),
 ]
+PLOT_NAMES = [name for name, _, _ in PLOTS]
+
+
+def collectors_for(plots):
+    """Return the statistics the named plots are built from, to count only those while parsing."""
+    needed = {name: collectors for name, _, collectors in PLOTS}
+    unknown = [name for name in plots if name not in needed]
+    if unknown:
+        raise ValueError(f"Unknown plots {', '.join(unknown)}, expected some of {', '.join(PLOT_NAMES)}")
+    return {collector for name in plots for collector in needed[name]}
+
+
 class ChatStatsPlotter:
-    def __init__(self,chat_data , plot_folder = "whatsapp_stat/plots"):
+    def __init__(self,chat_data , plot_folder = "whatsapp_stat/plots", render_workers=1, use_cache=True):
         self.hour_dict = chat_data.hour_dict
         self.month_dict =chat_data.month_dict
         self.year_dict = chat_data.year_dict
@@ -33,24 +57,170 @@ class ChatStatsPlotter:
         self.two_word_dict = chat_data.two_word_dict
         self.three_word_dict = chat_data.three_word_dict
         self.person_next_message = chat_data.person_next_message
+        self.chat_data = chat_data
+        self.instrumentation = getattr(chat_data, 'instrumentation', NULL_INSTRUMENTATION)
         os.makedirs(self.plots_folder, exist_ok=True)  # Ensure the plots folder exists
+        # With the cache, charts whose data and layout did not change since the last run are not rendered again
+        self.renderer = PlotRenderer(workers=render_workers, plots_folder=self.plots_folder if use_cache else None,
+                                     instrumentation=self.instrumentation)
+        if self.instrumentation.enabled:
+            self._instrument()
+
+    def _instrument(self):
+        """Time every plot_* method, the figure building behind it and the DataFrames it builds."""
+        for name in dir(self):
+            if name.startswith(('plot_', '_build_')) or name == '_distribution_frame':
+                setattr(self, name, self.instrumentation.timed(name.lstrip('_'), getattr(self, name)))
+        self.renderer.render = self.instrumentation.timed('render', self.renderer.render)
+
+    def _distribution_frame(self, name, column):
+        """Take the distribution DataFrame straight from the chat data when it can build one."""
+        if hasattr(self.chat_data, 'distribution_frame'):
+            return self.chat_data.distribution_frame(name, column)
+        counts = getattr(self, f"{name}_dict")
+        return pd.DataFrame({column: list(counts.keys()), 'Count': list(counts.values())})
+
+    def _error_note(self, phrase_dict, counts):
+        """Title suffix for phrase counts that come from an approximate counter.
+
+        When the error bound reaches the highest count the ranking is noise, which is said in the
+        title and printed as a warning.
+        """
+        error_bound = getattr(phrase_dict, 'error_bound', None)
+        if error_bound is None:
+            return ''
+        if error_bound and error_bound >= max(counts):
+            print(f"Warning: the {phrase_dict.n}-word phrase counts of {self.chat_data.chat_name} may be up to {error_bound} low, "
+                  f"more than the highest count, so their ranking is noise. Use a larger ngram_capacity.")
+            return f' (approximate, counts may be up to {error_bound} low, ranking unreliable)'
+        return f' (approximate, counts may be up to {error_bound} low)'
+
+    def _top_words(self, person, n):
+        """Return the ``n`` most common ``(word, count)`` pairs of one person without touching the word dict."""
+        if hasattr(self.chat_data, 'top_words'):
+            return self.chat_data.top_words(person, n)
+        word_counts = Counter({word: counts[person] for word, counts in self.person_word_count_dict.items() if counts.get(person, 0) > 0})
+        return word_counts.most_common(n)
+
+    def _top_words_overall(self, n):
+        """Return the ``n`` most common ``(word, count)`` pairs of the whole chat."""
+        if hasattr(self.chat_data, 'top_words_overall'):
+            return self.chat_data.top_words_overall(n)
+        return heapq.nlargest(n, ((word, counts['count']) for word, counts in self.person_word_count_dict.items() if 'count' in counts),
+                              key=lambda item: item[1])
+
+    def _top_dates(self, n):
+        """Return the ``n`` days with the most messages as ``(date, count)`` pairs."""
+        if hasattr(self.chat_data, 'top_dates'):
+            return self.chat_data.top_dates(n)
+        return heapq.nlargest(n, self.date_dict.items(), key=lambda item: item[1])
+
+    def _top_phrases(self, phrase_dict, n):
+        """Return the ``n`` most common ``(phrase, count)`` pairs of a phrase dict."""
+        if hasattr(phrase_dict, 'most_common'):
+            return phrase_dict.most_common(n)
+        sorted_phrases = heapq.nlargest(n, phrase_dict.items(), key=lambda x: x[1]['count'])
+        return [(phrase, data['count']) for phrase, data in sorted_phrases]
+
+    def _build_sections(self, plots=None):
+        """Build the figures of ``plots``, all of them by default, grouped into ``(title, figures)`` sections.
 
-    def plot_all(self):
-        self.plot_next_message_distribution()
-        self.plot_word_distribution(BAD_WORDS , title="Curses Words")
-        self.plot_word_distribution( GOOD_WORDS, title="Good Words")
-        self.plot_name_distribution()
-        self.plot_year_distribution()
-        self.plot_month_distribution()
-        self.plot_date_distribution()
-        self.plot_hour_distribution()
-        self.plot_top_25_words_by_person()
-        self.plot_top_25_words_overall()
-        self.plot_top_30_dates()
-        self.plot_top_25_three_word_phrases()
-        self.plot_top_25_two_word_phrases()
+        The chat data is asked to count the statistics these plots need first, so a chat parsed
+        with only some collectors counts the others on demand and a subset counts only its own.
+        An aggregate can't count what it lacks, so by default the plots of its missing statistics
+        are left out, while asking for them by name raises ``ValueError``.
+        """
+        if plots is None:
+            try:
+                self._collect(collectors_for(PLOT_NAMES))
+                plots = PLOT_NAMES
+            except ValueError:
+                plots = [name for name, _, collectors in PLOTS if set(collectors) <= self.chat_data.collectors]
+        else:
+            self._collect(collectors_for(plots))
+        return [(title, getattr(self, f"_build_{name}")()) for name, title, _ in PLOTS if name in plots]
+
+    def _collect(self, collectors):
+        if hasattr(self.chat_data, 'collect'):
+            self.chat_data.collect(collectors)
+
+    def _render(self, name):
+        self._collect(collectors_for([name]))
+        return self.renderer.render(getattr(self, f"_build_{name}")())
+
+    def plot_all(self, plots=None):
+        """Build the figures of ``plots`` (every plot by default) first, then render them all in one batch.
+
+        Raises ``ValueError`` when the ``plots`` asked for build no figure at all, so a filter that
+        matches nothing in the chat is not mistaken for a successful run.
+        """
+        figures = [figure for _, section in self._build_sections(plots) for figure in section]
+        if plots is not None and not figures:
+            raise ValueError(f"No figures for {', '.join(plots)} in {self.chat_data.chat_name}")
+        return self.renderer.render(figures)
+
+    def write_dashboard(self, path=None, plots=None):
+        """Write the charts of ``plots`` into one self-contained HTML page instead of image files, and return its path.
+
+        Nothing is rasterized, the charts are drawn by the browser. The per-person charts of a
+        section are picked from a list on the page.
+        """
+        path = path or os.path.join(self.plots_folder, 'dashboard.html')
+        size = write_dashboard(path, self.chat_data.chat_name, self._build_sections(plots))
+        self.instrumentation.count('bytes_written', size)
+        print(f"Wrote {path}")
+        return path
 
     def plot_next_message_distribution(self):
+        return self._render('next_message_distribution')
+
+    def plot_reply_latency(self):
+        return self._render('reply_latency')
+
+    def plot_session_distribution(self):
+        return self._render('session_distribution')
+
+    def plot_word_distribution(self, word_list , title="Words"):
+        self._collect(['words'])
+        return self.renderer.render(self._build_word_distribution(word_list, title=title))
+
+    def plot_lexicon_distribution(self, name):
+        self._collect(['lexicons'])
+        return self.renderer.render(self._build_lexicon_distribution(name))
+
+    def plot_top_30_dates(self):
+        return self._render('top_30_dates')
+
+    def plot_hour_distribution(self):
+        return self._render('hour_distribution')
+
+    def plot_month_distribution(self):
+        return self._render('month_distribution')
+
+    def plot_year_distribution(self):
+        return self._render('year_distribution')
+
+    def plot_date_distribution(self):
+        return self._render('date_distribution')
+
+    def plot_name_distribution(self):
+        return self._render('name_distribution')
+
+    def plot_top_25_words_by_person(self):
+        """Plot and save the top 25 most common words for each person."""
+        return self._render('top_25_words_by_person')
+
+    def plot_top_25_words_overall(self):
+        return self._render('top_25_words_overall')
+
+    def plot_top_25_two_word_phrases(self):
+        return self._render('top_25_two_word_phrases')
+
+    def plot_top_25_three_word_phrases(self):
+        return self._render('top_25_three_word_phrases')
+
+    def _build_next_message_distribution(self):
+        figures = []
         for person, next_dict in self.person_next_message.items():
             plot_data = [{'next_person': next_person, 'count': count} for next_person, count in next_dict.items()]
             plot_data.sort(key=lambda x: x["count"], reverse=True)
@@ -94,15 +264,123 @@ class ChatStatsPlotter:
                 height=HEIGHT  # Set the height of the image)
             )
             
-            os.makedirs(f'{self.plots_folder}/next', exist_ok=True)
-            fig.write_image(f'{self.plots_folder}/next/{person}_next_message.png')
+            figures.append((f'{self.plots_folder}/next/{person}_next_message.png', fig))
+        return figures
+
+    def _build_reply_latency(self):
+        """A grid of the median reply time of every pair, and how fast each person replied to each other one."""
+        sessions = getattr(self.chat_data, 'sessions', None)
+        latency = sessions.latency_counts() if sessions is not None else {}
+        if not latency:
+            return []
+        persons = sorted(set(latency) | {replied_to for counts in latency.values() for replied_to in counts})
+        labels = [bucket_label(bucket) for bucket in range(LOG_BUCKETS)]
+        medians = [[median_bucket(latency.get(replier, {}).get(replied_to, [])) for replied_to in persons] for replier in persons]
+
+        fig = go.Figure(go.Heatmap(
+            z=medians,
+            x=persons,
+            y=persons,
+            text=[[labels[bucket] if bucket is not None else '' for bucket in row] for row in medians],
+            texttemplate='%{text}',
+            colorscale='Blues',
+            zmin=0,
+            zmax=LOG_BUCKETS - 1,
+            colorbar=dict(title='Median', tickvals=list(range(0, LOG_BUCKETS, 3)), ticktext=labels[::3]),
+            hovertemplate='%{y} replying to %{x}: %{text}<extra></extra>'
+        ))
+        fig.update_layout(
+            title='Median Reply Time',
+            xaxis_title='Replying To',
+            yaxis_title='Replier',
+            xaxis_title_font=dict(size=AXIS_SIZE, family='Arial', color='DarkSlateGray'),
+            yaxis_title_font=dict(size=AXIS_SIZE, family='Arial', color='DarkSlateGray'),
+            title_font=dict(size=TITLE_SIZE, family='Arial', color='DarkSlateGray'),
+            xaxis=dict(tickangle=-45, tickfont=dict(size=TICK_SIZE, color='Black')),
+            yaxis=dict(tickfont=dict(size=TICK_SIZE, color='Black')),
+            paper_bgcolor='rgba(255, 255, 255, 0.9)',  # Slightly off-white plot background
+            margin=dict(l=150, r=50, t=100, b=150),
+            width=WIDTH,  # Set the width of the image
+            height=HEIGHT  # Set the height of the image
+        )
+        figures = [(f'{self.plots_folder}/reply_time.png', fig)]
+
+        for replier, counts in latency.items():
+            plot_data = [{'latency': labels[bucket], 'replied_to': replied_to, 'count': count}
+                         for replied_to, buckets in counts.items() for bucket, count in enumerate(buckets) if count]
+            df = pd.DataFrame(plot_data)
+            fig = px.bar(df, x='latency', y='count', color='replied_to', title=f'How Fast {replier} Replied',
+                         labels={'count': 'Replies', 'latency': 'Reply Time', 'replied_to': 'Replying To'},
+                         category_orders={'latency': labels},
+                         color_discrete_sequence=px.colors.qualitative.Plotly)
+            fig.update_layout(
+                xaxis_title='Reply Time',
+                yaxis_title='Replies',
+                xaxis_title_font=dict(size=AXIS_SIZE, family='Arial', color='DarkSlateGray'),
+                yaxis_title_font=dict(size=AXIS_SIZE, family='Arial', color='DarkSlateGray'),
+                title_font=dict(size=TITLE_SIZE, family='Arial', color='DarkSlateGray'),
+                xaxis=dict(tickangle=-45, tickfont=dict(size=TICK_SIZE, color='Black')),
+                yaxis=dict(tickfont=dict(size=TICK_SIZE, color='Black'), showgrid=True, gridcolor='LightGray'),
+                legend=dict(font=dict(size=TICK_SIZE, color='Black')),
+                plot_bgcolor='rgba(243, 243, 243, 0.5)',  # Light background color for the entire chart
+                paper_bgcolor='rgba(255, 255, 255, 0.9)',  # Slightly off-white plot background
+                margin=dict(l=80, r=20, t=60, b=100),
+                barmode='stack',
+                width=WIDTH,  # Set the width of the image
+                height=HEIGHT  # Set the height of the image
+            )
+            figures.append((f'{self.plots_folder}/replies/{replier}_reply_time.png', fig))
+        return figures
+
+    def _build_session_distribution(self):
+        """How many conversation sessions there were by their number of messages and of participants."""
+        sessions = getattr(self.chat_data, 'sessions', None)
+        if sessions is None:
+            return []
+        messages, participants = sessions.session_counts()
+        if not messages:
+            return []
+        # Message counts are bucketed like the reply times, since a few sessions run into the thousands
+        message_buckets = [0] * LOG_BUCKETS
+        for size, count in messages.items():
+            message_buckets[log_bucket(size)] += count
+        last_bucket = max(bucket for bucket, count in enumerate(message_buckets) if count)
+        frames = [
+            ('session_messages', 'Messages', f'Conversation Sessions by Messages (a session ends after {sessions.gap} minutes of silence)',
+             pd.DataFrame({'Messages': [bucket_label(bucket, minutes=False) for bucket in range(1, last_bucket + 1)],
+                           'Sessions': message_buckets[1:last_bucket + 1]})),
+            ('session_participants', 'Participants', 'Conversation Sessions by Participants',
+             pd.DataFrame({'Participants': sorted(participants), 'Sessions': [participants[size] for size in sorted(participants)]})),
+        ]
+        figures = []
+        for name, column, title, df in frames:
+            fig = px.bar(df, x=column, y='Sessions', title=title, text='Sessions',
+                         color='Sessions', color_continuous_scale='Blues')
+            fig.update_layout(
+                xaxis_title=column,
+                yaxis_title='Sessions',
+                xaxis_title_font=dict(size=AXIS_SIZE, family='Arial', color='DarkSlateGray'),
+                yaxis_title_font=dict(size=AXIS_SIZE, family='Arial', color='DarkSlateGray'),
+                title_font=dict(size=TITLE_SIZE, family='Arial', color='DarkSlateGray'),
+                xaxis=dict(tickfont=dict(size=TICK_SIZE, color='Black'), type='category'),
+                yaxis=dict(tickfont=dict(size=TICK_SIZE, color='Black'), showgrid=True, gridcolor='LightGray'),
+                plot_bgcolor='rgba(243, 243, 243, 0.5)',  # Light background color for the entire chart
+                paper_bgcolor='rgba(255, 255, 255, 0.9)',  # Slightly off-white plot background
+                margin=dict(l=80, r=20, t=60, b=100),
+                width=WIDTH,  # Set the width of the image
+                height=HEIGHT  # Set the height of the image
+            )
+            fig.update_traces(texttemplate='%{y}', textposition='outside', cliponaxis=False)
+            figures.append((f"{self.plots_folder}/{name}.png", fig))
+        return figures
     
-    def plot_word_distribution(self, word_list , title="Words"):
+    def _build_word_distribution(self, word_list , title="Words"):
         plot_data = []
         for word_group in word_list:
             person_total_counts = {}
             for word in word_group:
-                for person, count in self.person_word_count_dict[word].items():
+                # get, so words that never appeared are not added to the word counts
+                for person, count in self.person_word_count_dict.get(word, {}).items():
                     if person != 'count':
                         if person not in person_total_counts:
                             person_total_counts[person] = 0
@@ -110,7 +388,27 @@ class ChatStatsPlotter:
 
             for person, total_count in person_total_counts.items():
                 plot_data.append({"word": word_group[0], "person": person, "count": total_count})
+        return self._word_distribution_figure(plot_data, title)
+
+    def _build_lexicon_distributions(self):
+        """Figures of every lexicon counted while parsing, or of the built-in word lists for data without lexicons."""
+        lexicon_counts = getattr(self.chat_data, 'lexicon_counts', None)
+        if lexicon_counts is None:
+            return self._build_word_distribution(BAD_WORDS, title="Curses Words") + self._build_word_distribution(GOOD_WORDS, title="Good Words")
+        figures = []
+        for name in lexicon_counts:
+            figures += self._build_lexicon_distribution(name)
+        return figures
+
+    def _build_lexicon_distribution(self, name):
+        """Figure of one lexicon from its per group and person counts, with no lookups in the word counts."""
+        plot_data = [{"word": group, "person": person, "count": count}
+                     for group, counts in self.chat_data.lexicon_counts[name].items() for person, count in counts.items()]
+        return self._word_distribution_figure(plot_data, name)
 
+    def _word_distribution_figure(self, plot_data, title):
+        if not plot_data:
+            return []
         df = pd.DataFrame(plot_data)
 
         # Create the bar chart with Plotly Express
@@ -152,12 +450,14 @@ class ChatStatsPlotter:
 
         fig.update_traces(texttemplate='%{y}', textposition='outside')
         
-        fig.write_image(f"{self.plots_folder}/{title}_distribution.png")
+        return [(f"{self.plots_folder}/{title}_distribution.png", fig)]
     
-    def plot_top_30_dates(self):
-        # Sort dates by count and select the top 30
-        sorted_dates = sorted(self.date_dict.items(), key=lambda x: x[1], reverse=True)[:30]
-        dates, counts = zip(*sorted_dates)
+    def _build_top_30_dates(self):
+        # The 30 busiest dates
+        top_dates = self._top_dates(30)
+        if not top_dates:
+            return []
+        dates, counts = zip(*top_dates)
         
         # Create a DataFrame
         df = pd.DataFrame({'Date': dates, 'Count': counts})
@@ -199,14 +499,11 @@ class ChatStatsPlotter:
             cliponaxis=False  # Ensure labels are not clipped by the axis
         )
         
-        # Save the plot as an image
-        fig.write_image(f"{self.plots_folder}/top_30_dates.png")
+        return [(f"{self.plots_folder}/top_30_dates.png", fig)]
 
 
-    def plot_hour_distribution(self):
-        hours = list(self.hour_dict.keys())
-        counts = list(self.hour_dict.values())
-        df = pd.DataFrame({'Hour': hours, 'Count': counts})
+    def _build_hour_distribution(self):
+        df = self._distribution_frame('hour', 'Hour')
         
         fig = px.bar(df, x='Hour', y='Count', title='Messages Distribution by Hour',
                     labels={'Count': 'Number of Messages', 'Hour': 'Hour of the Day'},
@@ -222,12 +519,10 @@ class ChatStatsPlotter:
         
         fig.update_traces(texttemplate='%{y}', textposition='outside')
         
-        fig.write_image(os.path.join(self.plots_folder, 'hour_distribution.png'))
+        return [(os.path.join(self.plots_folder, 'hour_distribution.png'), fig)]
     
-    def plot_month_distribution(self):
-        months = list(self.month_dict.keys())
-        counts = list(self.month_dict.values())
-        df = pd.DataFrame({'Month': months, 'Count': counts})
+    def _build_month_distribution(self):
+        df = self._distribution_frame('month', 'Month')
     
         fig = px.bar(df, x='Month', y='Count', title='Messages Distribution by Month',
                     labels={'Count': 'Number of Messages', 'Month': 'Month'},
@@ -243,13 +538,10 @@ class ChatStatsPlotter:
         
         fig.update_traces(texttemplate='%{y}', textposition='outside')
         
-        fig.write_image(os.path.join(self.plots_folder, 'month_distribution.png'))
+        return [(os.path.join(self.plots_folder, 'month_distribution.png'), fig)]
     
-    def plot_year_distribution(self):
-        years = list(self.year_dict.keys())
-        counts = list(self.year_dict.values())
-
-        df = pd.DataFrame({'Year': years, 'Count': counts})
+    def _build_year_distribution(self):
+        df = self._distribution_frame('year', 'Year')
         
         # Create the bar chart with Plotly Express
         fig = px.bar(df, x='Year', y='Count', title='Messages Distribution by Year',
@@ -287,14 +579,10 @@ class ChatStatsPlotter:
             textfont=dict(size=TICK_SIZE, color='Black')  # Adjust font size and color for text
         )
         
-        # Save the plot as an image
-        fig.write_image(os.path.join(self.plots_folder, 'year_distribution.png'))
+        return [(os.path.join(self.plots_folder, 'year_distribution.png'), fig)]
     
-    def plot_date_distribution(self):
-        dates = list(self.date_dict.keys())
-        counts = list(self.date_dict.values())
-
-        df = pd.DataFrame({'Date': dates, 'Count': counts})
+    def _build_date_distribution(self):
+        df = self._distribution_frame('date', 'Date')
         
         # Create the line plot with Plotly Express
         fig = px.line(df, x='Date', y='Count', title='Messages Distribution by Date',
@@ -324,13 +612,9 @@ class ChatStatsPlotter:
             height=HEIGHT  # Set the height of the image)
         )
         
-        # Save the plot as an image
-        fig.write_image(os.path.join(self.plots_folder, 'date_distribution.png'))
-    def plot_name_distribution(self):
-        names = list(self.name_dict.keys())
-        counts = list(self.name_dict.values())
-
-        df = pd.DataFrame({'Person': names, 'Count': counts})
+        return [(os.path.join(self.plots_folder, 'date_distribution.png'), fig)]
+    def _build_name_distribution(self):
+        df = self._distribution_frame('name', 'Person')
     
         fig = px.bar(df, x='Person', y='Count', title='Messages Distribution by Person',
                     labels={'Count': 'Number of Messages', 'Person': 'Person'},
@@ -365,13 +649,14 @@ class ChatStatsPlotter:
             textfont=dict(size=TICK_SIZE, color='Black')
         )
         
-        fig.write_image(os.path.join(self.plots_folder, 'name_distribution.png'))
+        return [(os.path.join(self.plots_folder, 'name_distribution.png'), fig)]
     
-    def plot_top_25_words_by_person(self):
-        """Plot and save the top 25 most common words for each person."""
-        for person in self.name_dict.keys():
-            word_counts = Counter({word: self.person_word_count_dict[word][person] for word in self.person_word_count_dict if self.person_word_count_dict[word][person] > 0})
-            most_common_words = word_counts.most_common(25)
+    def _build_top_25_words_by_person(self):
+        """Build the top 25 most common words figure for each person."""
+        figures = []
+        # The persons of the word counts, the name counts may not be collected
+        for person in list(self.chat_data.person_word_index):
+            most_common_words = self._top_words(person, 25)
             if most_common_words:
                 words, counts = zip(*most_common_words)
                 df = pd.DataFrame({'Word': words, 'Count': counts})
@@ -408,15 +693,11 @@ class ChatStatsPlotter:
                     textposition='outside',
                     textfont=dict(size=TICK_SIZE, color='Black')
                 )
-            os.makedirs(f'{self.plots_folder}/top25', exist_ok=True)
-            fig.write_image(os.path.join(self.plots_folder, 'top25', f'{person}_top_25_words.png'))
-                
-    def plot_top_25_words_overall(self):
-        total_word_counts = Counter()
-        for word in self.person_word_count_dict:
-            total_word_counts[word] = self.person_word_count_dict[word]['count']
-        
-        most_common_words = total_word_counts.most_common(25)
+                figures.append((os.path.join(self.plots_folder, 'top25', f'{person}_top_25_words.png'), fig))
+        return figures
+
+    def _build_top_25_words_overall(self):
+        most_common_words = self._top_words_overall(25)
         if most_common_words:
             words, counts = zip(*most_common_words)
             df = pd.DataFrame({'Word': words, 'Count': counts})
@@ -454,15 +735,18 @@ class ChatStatsPlotter:
                 textfont=dict(size=TICK_SIZE, color='Black')
             )
             
-            fig.write_image(os.path.join(self.plots_folder, 'top_25_words_overall.png'))
+            return [(os.path.join(self.plots_folder, 'top_25_words_overall.png'), fig)]
+        return []
     
-    def plot_top_25_two_word_phrases(self):
-        sorted_phrases = sorted(self.two_word_dict.items(), key=lambda x: x[1]['count'], reverse=True)[:25]
-        phrases, counts = zip(*[(phrase, data['count']) for phrase, data in sorted_phrases])
+    def _build_top_25_two_word_phrases(self):
+        top_phrases = self._top_phrases(self.two_word_dict, 25)
+        if not top_phrases:
+            return []
+        phrases, counts = zip(*top_phrases)
 
         df = pd.DataFrame({'Phrase': phrases, 'Count': counts})
         
-        fig = px.bar(df, y='Count', x='Phrase', title='Top 25 Two-Word Phrases',
+        fig = px.bar(df, y='Count', x='Phrase', title='Top 25 Two-Word Phrases' + self._error_note(self.two_word_dict, counts),
                     labels={'Count': 'Number of Occurrences', 'Phrase': '2-Word Phrase'},
                     color='Count', color_continuous_scale='viridis',
                     text='Count')
@@ -495,14 +779,16 @@ class ChatStatsPlotter:
             textfont=dict(size=TICK_SIZE, color='Black')
         )
         
-        fig.write_image(os.path.join(self.plots_folder, 'top_25_two_word_phrases.png'))
-    def plot_top_25_three_word_phrases(self):
-        sorted_phrases = sorted(self.three_word_dict.items(), key=lambda x: x[1]['count'], reverse=True)[:25]
-        phrases, counts = zip(*[(phrase, data['count']) for phrase, data in sorted_phrases])
+        return [(os.path.join(self.plots_folder, 'top_25_two_word_phrases.png'), fig)]
+    def _build_top_25_three_word_phrases(self):
+        top_phrases = self._top_phrases(self.three_word_dict, 25)
+        if not top_phrases:
+            return []
+        phrases, counts = zip(*top_phrases)
 
         df = pd.DataFrame({'Phrase': phrases, 'Count': counts})
         
-        fig = px.bar(df, y='Count', x='Phrase', title='Top 25 Three-Word Phrases',
+        fig = px.bar(df, y='Count', x='Phrase', title='Top 25 Three-Word Phrases' + self._error_note(self.three_word_dict, counts),
                     labels={'Count': 'Number of Occurrences', 'Phrase': '3-Word Phrase'},
                     color='Count', color_continuous_scale='plasma',
                     text='Count')
@@ -537,5 +823,4 @@ class ChatStatsPlotter:
             textfont=dict(size=TICK_SIZE, color='Black')
         )
 
-        # Save the plot as an image
-        fig.write_image(os.path.join(self.plots_folder, 'top_25_three_word_phrases.png'))
\ No newline at end of file
+        return [(os.path.join(self.plots_folder, 'top_25_three_word_phrases.png'), fig)]
\ No newline at end of file
@@ -1,155 +1,617 @@
-import re
 import os
+import mmap
 import json
-from collections import defaultdict
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-HISTORY_FILE_PATH = 'whatsapp_stat/files/history_stat.json'
-MEDIA = ["<המדיה לא נכללה>"]
+import numpy as np
+
+from chat_aggregate import COLLECTORS, WORD_COLLECTORS, ChatAggregate
+from instrumentation import NULL_INSTRUMENTATION
+from lexicon import lexicon_signature, load_lexicons
+from message_table import EPOCH_ORDINAL, MINUTES_PER_DAY, MessageTable
+from name_mapping import NameMapping
+from sessions import SESSION_GAP_MINUTES, SessionTracker
+from stats_store import STAT_NAMES, StatsStore
+from time_index import TimeIndex
+from timestamps import TimestampDecoder, detect_locale, line_pattern
+
+CHECKPOINT_FOLDER = 'whatsapp_stat/files/checkpoints'
+CHECKPOINT_VERSION = 9
 UNSTAT_MESSAGES = []
-WITHOUT_WORDS =['לא', 'מה', 'מדיה', 'זה', 'את', 'של', 'על', 'יש', 'אתה', 'עם', 'אני', 'אין', 'הוא', 'אבל', 'איזה', 'גם', 'כל', 'לי', 'רק', 'היה', 'אם', 'טוב', 'חייב', 'כן']
+# Messages whose words are tokenized and counted together
+WORD_BATCH = 4096
 
-class ChatStats:
-    def __init__(self, filepath = 'whatsapp_stat/files/chat_brothers.txt'):
+class ChatStats(ChatAggregate):
+    def __init__(self, filepath = 'whatsapp_stat/files/chat_brothers.txt', keep_messages=False, use_checkpoint=True, workers=1, columnar=False,
+                 ngram_capacity=None, unknown_senders='ask', locale='auto', instrumentation=None, lexicons=None,
+                 session_gap=SESSION_GAP_MINUTES, collectors=None, tokenizer=None):
         self.filepath = filepath
-        self.chat_name = filepath.split("/")[-1].split(".")[0]
-        self.hour_dict = defaultdict(int)
-        self.month_dict = defaultdict(int)
-        self.year_dict = defaultdict(int)
-        self.date_dict = defaultdict(int)
-        self.name_dict = defaultdict(int)
-        self.person_word_count_dict = defaultdict(lambda: defaultdict(int))
-        self.person_next_message = defaultdict(lambda: defaultdict(int))
-        self.two_word_dict = defaultdict(lambda: defaultdict(int))
-        self.three_word_dict = defaultdict(lambda: defaultdict(int))
-        self.name_mapping = {}
+        self.locale = detect_locale(filepath) if locale == 'auto' else locale
+        self._set_locale()
+        self.keep_messages = keep_messages
+        # A checkpoint only holds the statistics, so it can't be used when the messages are kept
+        self.use_checkpoint = use_checkpoint and not keep_messages and not columnar
+        self.workers = workers
+        super().__init__(chat_name_of(filepath), ngram_capacity, load_lexicons() if lexicons is None else lexicons, session_gap, collectors,
+                         tokenizer)
+        # In columnar mode every message becomes a row of the table and the time and name
+        # distributions are computed from its columns after parsing
+        self.table = MessageTable(filepath) if columnar else None
+        self._time_index = None
+        self.names = NameMapping(self.chat_name, unknown=unknown_senders)
+        self.name_mapping = self.names.mapping
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        if self.instrumentation.enabled:
+            self._instrument()
         self.data = self._load_data()
-        if self.data:
-            self.save_statistics_to_json()
-
-    def save_statistics_to_json(self):
-        """Save hour, year, month, and person statistics to history.json if it does not already exist."""
-        if os.path.exists(HISTORY_FILE_PATH):
-            # Prepare data for JSON
-            data ={
-                    "hour_dict": json.dumps(self.hour_dict),
-                    "month_dict": json.dumps(self.month_dict),
-                    "year_dict": json.dumps(self.year_dict),
-                    "name_dict": json.dumps(self.name_dict),
-                }
-            existing_data={}
-            with open(HISTORY_FILE_PATH, 'r', encoding='utf-8') as file:
-                existing_data = json.load(file)
-            if self.chat_name in existing_data:
-                return
-            existing_data[self.chat_name] = data
-            with open(HISTORY_FILE_PATH, 'w', encoding='utf-8') as file:
-                json.dump(existing_data, file, ensure_ascii=False, indent=4)
-        else:
-            print("history.json not exists. No changes made.")
+        # The history snapshots hold the time and sender counts
+        if self.message_count and {'time', 'names'} <= self.collectors:
+            self.save_statistics()
+
+    @classmethod
+    def _for_chunk(cls, filepath, name_mapping, start, first_line, ngram_capacity, locale, lexicons, session_gap, collectors, tokenizer):
+        """Create an empty instance that parses one chunk of the file, usually inside a worker process."""
+        chunk = cls.__new__(cls)
+        chunk.filepath = filepath
+        chunk.locale = locale
+        chunk._set_locale()
+        chunk.ngram_capacity = ngram_capacity
+        chunk.session_gap = session_gap
+        chunk.tokenizer = tokenizer
+        chunk._set_collectors(collectors)
+        chunk._set_lexicons(lexicons)
+        chunk.keep_messages = False
+        chunk.table = None
+        chunk._reset_stats()
+        # The first session of the chunk may go on from the end of the chunk before it
+        chunk.sessions = SessionTracker(session_gap, continues=start > 0)
+        chunk.names = None
+        chunk.instrumentation = NULL_INSTRUMENTATION
+        chunk.name_mapping = name_mapping
+        chunk.parsed_offset = start
+        chunk.parsed_lines = first_line
+        return chunk
+
+    def _instrument(self):
+        """Time the parsing stages by wrapping them on this instance only, so the class stays untouched."""
+        for stage, name in [('load_data', '_load_data'), ('update_dicts', '_update_dicts'), ('process_message', '_process_messages'),
+                            ('merge_chunks', '_merge_chunk'), ('restore_checkpoint', '_restore_checkpoint'),
+                            ('save_checkpoint', '_save_checkpoint'), ('save_history', 'save_statistics'), ('collect', 'collect')]:
+            setattr(self, name, self.instrumentation.timed(stage, getattr(self, name)))
+
+    def _set_locale(self):
+        self.line_pattern = line_pattern(self.locale)
+        self.decoder = TimestampDecoder(self.locale)
+
+    def _reset_stats(self):
+        super()._reset_stats()
+        self.parsed_offset = 0
+        self.parsed_lines = 0
+        self.last_person = None
+        self.last_timestamp = None
+        self.continuation_lines = 0
+        self.system_lines = 0
+        self.parse_errors = 0
+        # Messages whose words are not counted yet
+        self._pending_persons = []
+        self._pending_messages = []
+
+    def save_statistics(self):
+        """Save the hour, month, year and person statistics as today's snapshot of this chat in the stats store."""
+        stats = {name: dict(getattr(self, name)) for name in STAT_NAMES}
+        StatsStore().save(self.chat_name, stats, self.message_count)
 
     def _load_data(self):
-        """Load and parse the chat data from the file."""
-        data = []
-        current_message = {}
-
-        with open(self.filepath, 'r', encoding='utf-8') as file:
-            last_person=None
-            for line_num, line in enumerate(file, start=1):
-                # Check if the line starts with a date and time pattern
-                match = re.match(
-                    r'(?P<date>\d{1,2}\.\d{1,2}\.\d{4}), (?P<time>\d{1,2}:\d{2}) - (?P<person>.*?): (?P<message>.*)',
-                    line
-                )
-                
-                if match:
-                    # If there's an ongoing message, save it to the data list before starting a new one
-                    if current_message:
-                        data.append(current_message)
-                    
-                    try:
-                        person_raw = match.group('person').strip()
-                        person = self._get_person(person_raw)
-                        if person == 'dont':
-                            continue
-                        current_message =self._update_dicts(match,person,last_person)
-                        last_person=person
-                    except Exception as e:
-                        print(f"Error parsing line {line_num}: {line}. Error: {e}")
-                        current_message = {}  # Reset if there's an error
-                else:
-                    # If the line doesn't start a new message, it's a continuation of the current one
-                    # print(f'data is {current_message}')
-                    # print(f'line {line_num}: {line}')
-                    if current_message:
-                        current_message["message"] += f" {line.strip()}"
-
-            # Append the last message if it exists
-            if current_message:
-                data.append(current_message)
+        """Parse the chat file and update the statistics.
+
+        Messages are counted as they stream out of ``_iter_messages`` and then dropped,
+        so memory stays flat no matter how long the export is. With ``keep_messages=True``
+        the parsed messages are also collected and returned as a list.
 
+        When a checkpoint of an earlier run matches the start of the file, only the
+        lines appended since then are parsed and counted on top of the saved statistics.
+        The statistics of the checkpoint go on being counted even if fewer were asked for, and
+        the ones it lacks are counted over the whole file, so it only ever grows.
+        """
+        requested = self.collectors
+        if self.use_checkpoint:
+            self._restore_checkpoint()
+        if self.instrumentation.enabled:
+            counts_before = self._run_counts()
+        data = [] if self.keep_messages else None
+        if self.workers > 1 and not self.keep_messages and self.table is None:
+            self._load_data_parallel()
+        else:
+            for message in self._iter_messages():
+                self.message_count += 1
+                if data is not None:
+                    data.append(message)
+        if requested - self.collectors:
+            self._count_missing(requested - self.collectors)
+        if self.table is not None:
+            self._fill_from_table()
+        if self.instrumentation.enabled:
+            for name, count in self._run_counts().items():
+                self.instrumentation.count(name, count - counts_before[name])
+        self.names.save()
+        # Nothing to save when no line was appended and no statistic was added since the checkpoint
+        if self.use_checkpoint and (self.parsed_offset != self._restored_offset or self.collectors != self._restored_collectors):
+            self._save_checkpoint()
         return data
+
+    def _run_counts(self):
+        """Totals behind the instrumentation counters, taken before and after parsing."""
+        return {
+            "lines": self.parsed_lines,
+            "bytes_read": self.parsed_offset,
+            "messages": self.message_count,
+            "continuation_lines": self.continuation_lines,
+            "system_lines": self.system_lines,
+            "errors": self.parse_errors,
+            "words": sum(sum(counts.values()) for counts in self.person_word_index.values()),
+            "ngrams": self.two_word_dict.total + self.three_word_dict.total,
+        }
+
+    def _load_data_parallel(self):
+        """Parse the unparsed part of the file in chunks on a process pool and merge the results.
+
+        The chunks start on message lines, so each worker only needs the name mapping to count
+        its messages on its own. The names are resolved up front in the order they first appear,
+        and the next-message transition and the session across every chunk seam are joined while
+        merging, so the result is the same as parsing the file in one go.
+        """
+        bounds = _find_chunk_bounds(self.filepath, self.parsed_offset, os.path.getsize(self.filepath), self.workers, self.locale)
+        chunks = list(zip(bounds, bounds[1:]))
+        if not chunks:
+            return
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks))) as pool:
+            scans = list(pool.map(_scan_chunk, [self.filepath] * len(chunks), *zip(*chunks), [self.locale] * len(chunks)))
+            first_lines = []
+            for senders, line_count in scans:
+                first_lines.append(self.parsed_lines)
+                self.parsed_lines += line_count
+                self.names.prefill(senders)
+
+            results = pool.map(_parse_chunk, [self.filepath] * len(chunks), [self.name_mapping] * len(chunks),
+                               *zip(*chunks), first_lines, [self.ngram_capacity] * len(chunks), [self.locale] * len(chunks),
+                               [self.lexicons] * len(chunks), [self.session_gap] * len(chunks), [self.collectors] * len(chunks),
+                               [self.tokenizer] * len(chunks))
+            for result in results:
+                self._merge_chunk(*result)
+        self.parsed_offset = bounds[-1]
+
+    def _merge_chunk(self, stats, counts, first_person, last_person, last_timestamp):
+        """Add the statistics of the next chunk returned by ``_parse_chunk``, joining it to the ones before."""
+        if self.last_person and first_person and self._count_next_message:
+            self.person_next_message[self.last_person][first_person] += 1
+        self.sessions.join(SessionTracker.from_state(stats.pop("sessions")))
+        self.merge_state(stats)
+        message_count, continuation_lines, system_lines, parse_errors = counts
+        self.message_count += message_count
+        self.continuation_lines += continuation_lines
+        self.system_lines += system_lines
+        self.parse_errors += parse_errors
+        self.last_person = last_person or self.last_person
+        self.last_timestamp = last_timestamp or self.last_timestamp
+
+    def _iter_messages(self, end=None):
+        """Yield the chat messages one by one, updating the statistics as each one starts.
+
+        The file is memory-mapped and the message lines are found by matching the line pattern
+        on the raw bytes, so only the first line of every message is decoded. Continuation lines
+        are only counted, and read once and joined when the messages are kept. System lines end
+        the current message and are counted on their own, without a sender or any statistics.
+        """
+        end = os.path.getsize(self.filepath) if end is None else end
+        if self.parsed_offset >= end:
+            return
+        current_message = None
+        with open(self.filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for match in self.line_pattern.finditer(data, self.parsed_offset, end):
+                # The lines up to this one continue the current message
+                if match.start() > self.parsed_offset:
+                    self._skip_lines(data, match.start(), current_message)
+                # A new message starts, so the previous one is complete
+                if current_message:
+                    yield current_message
+                current_message = None
+
+                line_end = data.find(b'\n', match.end(), end)
+                self.parsed_offset = end if line_end == -1 else line_end + 1
+                self.parsed_lines += 1
+                if match.group('person') is None:
+                    self.system_lines += 1
+                    continue
+                self._text_start = match.start('message')
+                try:
+                    person_raw = match.group('person').decode('utf-8').strip()
+                    person = self._get_person(person_raw)
+                    if person == 'dont':
+                        continue
+                    current_message =self._update_dicts(match,person,self.last_person)
+                    self.last_person=person
+                    self.last_timestamp = f"{current_message['date']} {current_message['time']:%H:%M}"
+                except Exception as e:
+                    line = data[match.start():self.parsed_offset].decode('utf-8', errors='replace')
+                    print(f"Error parsing line {self.parsed_lines}: {line}. Error: {e}")
+                    self.parse_errors += 1
+            if self.parsed_offset < end:
+                self._skip_lines(data, end, current_message)
+        self._flush_words()
+
+        # Yield the last message if it exists
+        if current_message:
+            yield current_message
+
+    def _skip_lines(self, data, stop, current_message):
+        """Move past the lines up to ``stop``, adding them to ``current_message`` if there is one."""
+        start = self.parsed_offset
+        lines = data[start:stop]
+        line_count = _count_lines(lines, start > 0 and data[start - 1] != ord('\n'))
+        self.parsed_lines += line_count
+        self.parsed_offset = stop
+        if current_message:
+            self.continuation_lines += line_count
+            # The text of the continuation lines is only needed when the messages are kept
+            if self.keep_messages:
+                lines = lines.decode('utf-8').split('\n')
+                if lines[-1] == '':
+                    lines.pop()
+                current_message["message"] = ' '.join([current_message["message"]] + [line.strip() for line in lines])
+            if self.table is not None:
+                self.table.extend_text(stop)
+
+    def _fill_from_table(self):
+        """Count the time and name distributions over the whole message table at once."""
+        names = (("hour", "month", "year", "date") if self._count_time else ()) + (("name",) if self._count_names else ())
+        for name in names:
+            target = getattr(self, f"{name}_dict")
+            for key, count in zip(*self.table.counts(name)):
+                target[key] += count
+                if name == "date":
+                    self._rank_date(key)
+
+    def distribution_frame(self, name, column):
+        """Return the ``name`` distribution as a DataFrame with ``column`` and ``Count`` columns."""
+        if self.table is not None:
+            return self.table.distribution(name, column)
+        return super().distribution_frame(name, column)
+
+    @property
+    def time_index(self):
+        """The sorted timestamp index of the message table, built on first use."""
+        if self.table is None:
+            raise ValueError("Time windows need the message table, create the ChatStats with columnar=True")
+        if self._time_index is None or len(self._time_index.minutes) != len(self.table):
+            self._time_index = TimeIndex(self.table)
+        return self._time_index
+
+    def window(self, start=None, end=None, persons=None, words=True, chat_name=None):
+        """Return the statistics of the messages between ``start`` and ``end`` as a ``ChatAggregate``.
+
+        ``start`` and ``end`` are dates or datetimes, a date covering its whole day, and
+        ``persons`` limits the messages to those senders. The counts by time and sender come from
+        the index without reading the file, the word and phrase counts (skipped with
+        ``words=False``) are taken only from the messages inside the window. The result plots
+        like a whole chat, without the word plots when their counts were skipped::
+
+            ChatStatsPlotter(chat_stats.window(date(2023, 1, 1), date(2023, 12, 31))).plot_all()
+        """
+        index = self.time_index
+        if chat_name is None:
+            chat_name = f"{self.chat_name}_{_window_label(start, 'start')}_{_window_label(end, 'end')}"
+        # Everything but the word statistics comes from the index, whatever this chat counted itself
+        aggregate = ChatAggregate(chat_name, self.ngram_capacity, self.lexicons, self.session_gap,
+                                  None if words else set(COLLECTORS) - WORD_COLLECTORS, self.tokenizer)
+        selected = np.array([persons is None or person in persons for person in index.persons], dtype=bool)
+        first, last = index.rows(start, end)
+        days, grid = index.day_grid(first, last)
+        grid = grid * selected[None, :, None]
+
+        for hour, count in enumerate(grid.sum(axis=(0, 1)).tolist()):
+            if count:
+                aggregate.hour_dict[hour] = count
+        for code, count in enumerate(grid.sum(axis=(0, 2)).tolist()):
+            if count:
+                aggregate.name_dict[index.persons[code]] = count
+        for day, count in zip(days.tolist(), grid.sum(axis=(1, 2)).tolist()):
+            if count:
+                date = index.day_to_date(day)
+                aggregate.date_dict[date] += count
+                aggregate._rank_date(date)
+                aggregate.month_dict[date.month] += count
+                aggregate.year_dict[date.year] += count
+        aggregate.message_count = int(grid.sum())
+
+        codes = index.person_codes[first:last]
+        for code, next_code in zip(codes[:-1].tolist(), codes[1:].tolist()):
+            if selected[code]:
+                aggregate.person_next_message[index.persons[code]][index.persons[next_code]] += 1
+        # Replies and sessions only among the selected senders, in time order
+        in_window = selected[codes]
+        for minute, code in zip(index.minutes[first:last][in_window].tolist(), codes[in_window].tolist()):
+            aggregate.sessions.add(minute, index.persons[code])
+
+        if words:
+            rows = index.order[first:last][selected[codes]]
+            aggregate._process_messages([index.persons[code] for code in self.table.person_codes[rows].tolist()],
+                                        list(self.table.first_lines(rows.tolist())))
+        return aggregate
+
+    def collect(self, collectors):
+        """Make sure the statistics of ``collectors`` are counted, and return this instance.
+
+        The missing ones are counted in one more pass over the parsed part of the file that counts
+        nothing else. The results are added to this instance, so each statistic is computed once
+        however many plots ask for it. The checkpoint is saved again with them.
+        """
+        missing = set(collectors) - self.collectors
+        if not missing:
+            return self
+        self._count_missing(missing)
+        if self.use_checkpoint:
+            self._save_checkpoint()
+        return self
+
+    def _count_missing(self, missing):
+        """Count the statistics of ``missing`` over the parsed part of the file and add them."""
+        extra = ChatStats._for_chunk(self.filepath, self.name_mapping, 0, 0, self.ngram_capacity, self.locale, self.lexicons,
+                                     self.session_gap, missing, self.tokenizer)
+        for _ in extra._iter_messages(self.parsed_offset):
+            pass
+        stats = extra.export_state(arrays=True)
+        # The tracker keeps its open session, so it goes on with messages appended later
+        if 'sessions' in missing:
+            self.sessions = extra.sessions
+        del stats["sessions"]
+        self.merge_state(stats)
+        self._set_collectors(self.collectors | missing)
+
+    def _checkpoint_path(self):
+        return os.path.join(CHECKPOINT_FOLDER, f"{self.chat_name}.npz")
+
+    def _restore_checkpoint(self):
+        """Load the saved statistics if the file still starts with the part that was already parsed.
+
+        The statistics counted become those of the checkpoint, which may be more or fewer than
+        were asked for; ``_load_data`` counts the missing ones.
+        """
+        self._prefix_hash = hashlib.sha256()
+        self._restored_offset = 0
+        self._restored_collectors = frozenset()
+        path = self._checkpoint_path()
+        if not os.path.exists(path):
+            return
+        with np.load(path) as archive:
+            checkpoint = json.loads(archive["checkpoint"].tobytes().decode('utf-8'))
+            arrays = {name: archive[name] for name in archive.files if name != "checkpoint"}
+        if (checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("ngram_capacity") != self.ngram_capacity
+                or checkpoint.get("session_gap") != self.session_gap or checkpoint.get("lexicons") != lexicon_signature(self.lexicons)
+                or checkpoint.get("tokenizer") != self.tokenizer.signature()):
+            print(f"Checkpoint {path} is from another version, mode, lexicons or tokenizer, parsing {self.filepath} from the start.")
+            return
+        offset = checkpoint["offset"]
+        prefix_hash = hashlib.sha256()
+        if os.path.getsize(self.filepath) < offset or _hash_file(self.filepath, 0, offset, prefix_hash).hexdigest() != checkpoint["prefix_sha256"]:
+            print(f"{self.filepath} does not match its checkpoint, parsing it from the start.")
+            return
+
+        # Senders nobody could be asked about when the checkpoint was saved are asked about now,
+        # a name other than the raw one they were counted under means parsing again
+        for person_raw in checkpoint["unresolved_names"]:
+            if person_raw not in self.name_mapping:
+                self.names.resolve(person_raw)
+        if any(self.name_mapping.get(person_raw, person) != person for person_raw, person in checkpoint["name_mapping"].items()):
+            print(f"The names of {self.chat_name} changed since its checkpoint, parsing {self.filepath} from the start.")
+            return
+
+        self._prefix_hash = prefix_hash
+        self._restored_offset = offset
+        self.parsed_offset = offset
+        self.parsed_lines = checkpoint["line_count"]
+        self.message_count = checkpoint["message_count"]
+        self.continuation_lines = checkpoint["continuation_lines"]
+        self.system_lines = checkpoint["system_lines"]
+        self.parse_errors = checkpoint["parse_errors"]
+        self.last_person = checkpoint["last_person"]
+        self.last_timestamp = checkpoint["last_timestamp"]
+        self._set_collectors(checkpoint["collectors"])
+        self._restored_collectors = self.collectors
+        for person_raw, person in checkpoint["name_mapping"].items():
+            self.name_mapping.setdefault(person_raw, person)
+        stats = checkpoint["stats"]
+        for name, array in arrays.items():
+            counter, field = name.split('.')
+            stats[counter][field] = array
+        # The session open at the end of the parsed part goes on with the appended messages
+        self.sessions = SessionTracker.from_state(stats.pop("sessions"))
+        self.merge_state(stats)
+
+    def _save_checkpoint(self):
+        """Save the parsed statistics together with the offset and hash of the parsed part of the file.
+
+        The checkpoint is a numpy ``.npz`` archive: the phrase counts are stored as their arrays,
+        everything else as one JSON document in its ``checkpoint`` entry.
+        """
+        # The hash of the restored prefix is extended with the newly parsed tail only
+        prefix_hash = _hash_file(self.filepath, self._restored_offset, self.parsed_offset, self._prefix_hash)
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "ngram_capacity": self.ngram_capacity,
+            "session_gap": self.session_gap,
+            "collectors": sorted(self.collectors),
+            "lexicons": lexicon_signature(self.lexicons),
+            "tokenizer": self.tokenizer.signature(),
+            "offset": self.parsed_offset,
+            "line_count": self.parsed_lines,
+            "prefix_sha256": prefix_hash.hexdigest(),
+            "last_timestamp": self.last_timestamp,
+            "last_person": self.last_person,
+            "message_count": self.message_count,
+            "continuation_lines": self.continuation_lines,
+            "system_lines": self.system_lines,
+            "parse_errors": self.parse_errors,
+            "name_mapping": self.name_mapping,
+            "unresolved_names": sorted(self.names.unresolved),
+            "stats": self.export_state(arrays=True),
+        }
+        arrays = {}
+        for counter in ("two_word_dict", "three_word_dict"):
+            state = checkpoint["stats"][counter]
+            for field in [field for field, value in state.items() if isinstance(value, np.ndarray)]:
+                arrays[f"{counter}.{field}"] = state.pop(field)
+        path = self._checkpoint_path()
+        os.makedirs(CHECKPOINT_FOLDER, exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            header = np.frombuffer(json.dumps(checkpoint, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+            np.savez(file, checkpoint=header, **arrays)
+        os.replace(path + '.tmp', path)
+        # The hash now covers the saved part, a later save extends it from there
+        self._prefix_hash = prefix_hash
+        self._restored_offset = self.parsed_offset
+        self._restored_collectors = self.collectors
+        self.instrumentation.count('bytes_written', os.path.getsize(path))
+
     def _get_person(self, person):
-        if person not in self.name_mapping:
-            new_name = input(f"Enter the name to replace '{person}': ")
-            if new_name=='':
-                self.name_mapping[person] = person
-            else:
-                self.name_mapping[person] = new_name
-        return self.name_mapping[person]
+        name = self.name_mapping.get(person)
+        if name is None:
+            name = self.names.resolve(person)
+        return name
     
     def _update_dicts(self,match,person , last_person):
-        date_str = match.group('date')
-        time_str = match.group('time')
-        message = match.group('message').strip()
+        date_str = match.group('date').decode('ascii')
+        time_str = match.group('time').decode('utf-8')
+        message = match.group('message').decode('utf-8').strip()
         
-        date = datetime.strptime(date_str, "%d.%m.%Y").date()
-        time = datetime.strptime(time_str, "%H:%M").time()
+        date = self.decoder.date(date_str)
+        time = self.decoder.time(time_str)
         hour = time.hour
         month = date.month
         year = date.year
         
         # Update statistics
-        self.hour_dict[hour] += 1
-        self.month_dict[month] += 1
-        self.year_dict[year] += 1
-        self.date_dict[date] += 1
-        self.name_dict[person] += 1
-        if last_person:
+        if self.table is not None:
+            self.table.append(date, time, person, self._text_start, self.parsed_offset)
+        else:
+            if self._count_time:
+                self.hour_dict[hour] += 1
+                self.month_dict[month] += 1
+                self.year_dict[year] += 1
+                count = self.date_dict[date] = self.date_dict[date] + 1
+                if count >= self.date_leaderboard.floor:
+                    self.date_leaderboard.offer(-date.toordinal(), count)
+            if self._count_names:
+                self.name_dict[person] += 1
+        if last_person and self._count_next_message:
             self.person_next_message[last_person][person]+=1
+        if self._count_sessions:
+            self.sessions.add((date.toordinal() - EPOCH_ORDINAL) * MINUTES_PER_DAY + hour * 60 + time.minute, person)
 
-        self._process_message(person, message)
+        if self._tokenize:
+            self._pending_persons.append(person)
+            self._pending_messages.append(message)
+            if len(self._pending_messages) >= WORD_BATCH:
+                self._flush_words()
         return  {
                 "date": date,
                 "time": time,
                 "person": person,
                 "message": message
             }
-    def _process_message(self,person,message):
-        if message in MEDIA:
-            self.person_word_count_dict["שליחה של מדיה"][person] += 1
-            self.person_word_count_dict["מדיה"]["count"] += 1
-            return
-        
-        cleaned_message = ''.join(char for char in message if char.isalpha() or char == ' ')
 
-        # Split the message into words, filtering out any words with length <= 1
-        words = [word for word in cleaned_message.split() if len(word) > 1]
-        
-        for i in range(len(words)):
-            word = words[i]
-            # Update single word statistics
-            self.person_word_count_dict[word][person] += 1
-            self.person_word_count_dict[word]['count'] += 1
-
-            # Update two-word phrase statistics
-            if i < len(words) - 1:
-                two_word_phrase = f"{words[i]} {words[i+1]}"
-                self.two_word_dict[two_word_phrase][person] += 1
-                self.two_word_dict[two_word_phrase]['count'] += 1
-
-            # Update three-word phrase statistics
-            if i < len(words) - 2:
-                three_word_phrase = f"{words[i]} {words[i+1]} {words[i+2]}"
-                self.three_word_dict[three_word_phrase][person] += 1
-                self.three_word_dict[three_word_phrase]['count'] += 1
\ No newline at end of file
+
+    def _flush_words(self):
+        """Count the words of the messages buffered by ``_update_dicts``."""
+        if self._pending_messages:
+            self._process_messages(self._pending_persons, self._pending_messages)
+            self._pending_persons, self._pending_messages = [], []
+
+
+def _hash_file(filepath, start, end, hasher):
+    """Feed the bytes of ``filepath`` between ``start`` and ``end`` into ``hasher`` and return it."""
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = file.read(min(remaining, 1 << 20))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _window_label(bound, default):
+    if bound is None:
+        return default
+    return bound.strftime('%Y-%m-%d_%H%M') if isinstance(bound, datetime) else bound.isoformat()
+
+
+def chat_name_of(filepath):
+    return filepath.split("/")[-1].split(".")[0]
+
+
+def scan_senders(filepath, locale='auto'):
+    """Return the distinct raw sender names of a chat file in the order they first appear."""
+    if locale == 'auto':
+        locale = detect_locale(filepath)
+    return _scan_chunk(filepath, 0, os.path.getsize(filepath), locale)[0]
+
+
+def _find_chunk_bounds(filepath, start, end, chunk_count, locale):
+    """Split the bytes between ``start`` and ``end`` into up to ``chunk_count`` ranges that begin on message lines."""
+    pattern = line_pattern(locale)
+    bounds = [start]
+    with open(filepath, 'rb') as file:
+        for i in range(1, chunk_count):
+            file.seek(max(start + (end - start) * i // chunk_count - 1, bounds[-1]))
+            file.readline()
+            offset = file.tell()
+            for raw_line in iter(file.readline, b''):
+                if pattern.match(raw_line):
+                    break
+                offset += len(raw_line)
+            if bounds[-1] < offset < end:
+                bounds.append(offset)
+    bounds.append(end)
+    return bounds
+
+
+def _scan_chunk(filepath, start, end, locale):
+    """Return the distinct senders of a chunk in the order they first appear, and its line count."""
+    with open(filepath, 'rb') as file:
+        file.seek(max(start - 1, 0))
+        before = file.read(1) if start > 0 else b''
+        data = file.read(end - start)
+    senders = dict.fromkeys(match.group('person').decode('utf-8').strip() for match in line_pattern(locale).finditer(data)
+                            if match.group('person') is not None)
+    return list(senders), _count_lines(data, before not in (b'', b'\n'))
+
+
+def _count_lines(lines, continues_line=False):
+    """Count the lines in the bytes ``lines``.
+
+    With ``continues_line`` they start in the middle of a line, as after a checkpoint of a file
+    that had no final newline, and a leading newline only ends that line.
+    """
+    if continues_line and lines.startswith(b'\n'):
+        lines = lines[1:]
+    return lines.count(b'\n') + (0 if lines.endswith(b'\n') or not lines else 1)
+
+
+def _parse_chunk(filepath, name_mapping, start, end, first_line, ngram_capacity, locale, lexicons, session_gap, collectors, tokenizer):
+    """Parse one chunk of the file in a worker process and return its statistics.
+
+    The phrase counts come back as arrays of the chunk's own word ids, see ``ChatAggregate.export_state``.
+    """
+    chunk = ChatStats._for_chunk(filepath, name_mapping, start, first_line, ngram_capacity, locale, lexicons, session_gap, collectors,
+                                 tokenizer)
+    first_person = None
+    for message in chunk._iter_messages(end):
+        chunk.message_count += 1
+        if first_person is None:
+            first_person = message["person"]
+    counts = (chunk.message_count, chunk.continuation_lines, chunk.system_lines, chunk.parse_errors)
+    return chunk.export_state(arrays=True), counts, first_person, chunk.last_person, chunk.last_timestamp
@@ -0,0 +1,104 @@
+import os
+import json
+import html
+
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: Arial, sans-serif; margin: 0; background: #f3f3f3; }}
+header {{ background: #2f4f4f; color: white; padding: 12px 20px; font-size: 22px; }}
+nav {{ display: flex; flex-wrap: wrap; gap: 4px; padding: 8px 20px; background: white; border-bottom: 1px solid #ddd; }}
+nav button {{ border: 1px solid #ccc; background: #fafafa; padding: 6px 12px; cursor: pointer; border-radius: 4px; }}
+nav button.active {{ background: #2f4f4f; color: white; }}
+main {{ padding: 12px 20px; }}
+select {{ font-size: 16px; margin-bottom: 8px; }}
+</style>
+</head>
+<body>
+<header>{title}</header>
+<nav id="tabs"></nav>
+<main><select id="items" hidden></select><div id="chart"></div></main>
+<script>{plotlyjs}</script>
+<script id="dashboard-data" type="application/json">{data}</script>
+<script>
+const dashboard = JSON.parse(document.getElementById('dashboard-data').textContent);
+const tabs = document.getElementById('tabs'), items = document.getElementById('items'), chart = document.getElementById('chart');
+
+function showItem(section, index) {{
+    const figure = section.items[index].figure;
+    const layout = Object.assign({{}}, figure.layout);
+    if (!layout.template) layout.template = dashboard.template;
+    Plotly.react(chart, figure.data, layout);
+}}
+
+function showSection(index) {{
+    const section = dashboard.sections[index];
+    tabs.querySelectorAll('button').forEach((button, i) => button.classList.toggle('active', i === index));
+    items.innerHTML = '';
+    section.items.forEach((item, i) => items.add(new Option(item.label, i)));
+    items.hidden = section.items.length < 2;
+    items.onchange = () => showItem(section, Number(items.value));
+    showItem(section, 0);
+}}
+
+dashboard.sections.forEach((section, index) => {{
+    const button = document.createElement('button');
+    button.textContent = section.title;
+    button.onclick = () => showSection(index);
+    tabs.appendChild(button);
+}});
+if (dashboard.sections.length) showSection(0);
+</script>
+</body>
+</html>
+"""
+
+
+def _item_labels(paths):
+    """Label the figures of a section by their file names, without the part all of them share."""
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(names) < 2:
+        return names
+    suffix = os.path.commonprefix([name[::-1] for name in names])[::-1]
+    return [name[:len(name) - len(suffix)] or name for name in names]
+
+
+def render_dashboard(title, sections):
+    """Return one self-contained HTML page with every figure of ``sections``.
+
+    ``sections`` is a list of ``(title, [(path, fig), ...])`` as the plotter builds them. Plotly.js
+    and the styling template shared by the figures are embedded once, the figures themselves as
+    JSON that is drawn in the browser only when its tab or item is picked.
+    """
+    template = None
+    data_sections = []
+    for section_title, figures in sections:
+        if not figures:
+            continue
+        section_items = []
+        for label, (_, fig) in zip(_item_labels([path for path, _ in figures]), figures):
+            figure = json.loads(pio.to_json(fig, validate=False))
+            figure_template = figure['layout'].get('template')
+            if template is None:
+                template = figure_template
+            if figure_template == template:
+                figure['layout'].pop('template', None)
+            section_items.append({'label': label, 'figure': figure})
+        data_sections.append({'title': section_title, 'items': section_items})
+    data = json.dumps({'template': template, 'sections': data_sections}, ensure_ascii=False, separators=(',', ':'))
+    return PAGE.format(title=html.escape(title), plotlyjs=get_plotlyjs(), data=data.replace('</', '<\\/'))
+
+
+def write_dashboard(path, title, sections):
+    """Write the dashboard of ``sections`` to ``path`` and return its size in bytes."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(render_dashboard(title, sections))
+    os.replace(path + '.tmp', path)
+    return os.path.getsize(path)
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+
+REPORTS_FOLDER = 'whatsapp_stat/files/reports'
+PROFILE_TOP = 30
+MEMORY_TOP = 15
+
+
+class Instrumentation:
+    """Per-stage timers and counters of one chat run, written as a JSON report.
+
+    ``ChatStats`` and ``ChatStatsPlotter`` wrap their hot methods with ``timed`` only when they
+    get an enabled instance, so without one nothing on the per-message path changes.
+
+    With ``profile=True`` the run is also captured with cProfile, and with ``trace_memory=True``
+    with tracemalloc. Both slow the run down a lot and are meant for looking into a slow chat.
+
+    Used as a context manager it starts the capture on enter and saves the report on exit::
+
+        with Instrumentation('chat_family', profile=True) as run:
+            chat_stats = ChatStats('whatsapp_stat/files/chat_family.txt', instrumentation=run)
+            ChatStatsPlotter(chat_stats).plot_all()
+    """
+    enabled = True
+
+    def __init__(self, chat_name, profile=False, trace_memory=False, folder=REPORTS_FOLDER):
+        self.chat_name = chat_name
+        self.path = os.path.join(folder, f'{chat_name}.json')
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.memory = None
+        self._started = None
+        self._total_seconds = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def timed(self, name, function):
+        """Return ``function`` wrapped so every call adds to the ``name`` stage."""
+        seconds, calls = self.seconds, self.calls
+        perf_counter = time.perf_counter
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[name] += perf_counter() - start
+                calls[name] += 1
+        return wrapper
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def start(self):
+        self._started = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:MEMORY_TOP]
+            tracemalloc.stop()
+            self.memory = {
+                "peak_bytes": peak,
+                "top_allocations": [{"line": str(stat.traceback), "bytes": stat.size, "blocks": stat.count} for stat in top],
+            }
+        if self._started is not None:
+            self._total_seconds = time.perf_counter() - self._started
+
+    def _profile_rows(self):
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                         "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)})
+        rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+        return rows[:PROFILE_TOP]
+
+    def report(self):
+        report = {
+            "chat_name": self.chat_name,
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "total_seconds": round(self._total_seconds, 4) if self._total_seconds is not None else None,
+            "stages": {name: {"seconds": round(seconds, 4), "calls": self.calls[name]} for name, seconds in self.seconds.items()},
+            "counters": dict(self.counters),
+        }
+        if self.profiler:
+            report["profile"] = self._profile_rows()
+        if self.memory:
+            report["memory"] = self.memory
+        return report
+
+    def save(self):
+        """Write the report to ``<folder>/<chat_name>.json`` and return its path."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, ensure_ascii=False, indent=4)
+        os.replace(self.path + '.tmp', self.path)
+        return self.path
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        self.save()
+        return False
+
+
+class NullInstrumentation:
+    """Stand-in used when a run is not instrumented. Every call is a no-op."""
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def timed(self, name, function):
+        return function
+
+    def count(self, name, amount=1):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -0,0 +1,67 @@
+import heapq
+
+# Entries kept per leaderboard, enough for every top-N plot
+LEADERBOARD_SIZE = 50
+
+
+class Leaderboard:
+    """The ``size`` keys with the highest counts, kept up to date while the counts grow.
+
+    ``offer`` is called with the new count of a key every time it grows. A key joins the board
+    when it ranks above the lowest entry, which then drops off, so no key off the board ranks
+    above one on it. Counts only grow, so the board always holds exactly the top ``size`` keys,
+    ties going to the larger key, in whatever order the counts were added. The lowest entry is
+    the top of a ``heapq`` heap with one entry per key. A key on the board that grows only
+    updates its count, its heap entry is moved down when it comes up at the top.
+
+    ``floor`` is the lowest count on a full board and 0 before it fills. A count below it can't
+    change the board, so callers compare against it before offering.
+    """
+    def __init__(self, size=LEADERBOARD_SIZE):
+        self.size = size
+        self.counts = {}
+        self.floor = 0
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def offer(self, key, count):
+        counts = self.counts
+        if key in counts:
+            counts[key] = count
+            return
+        if len(counts) < self.size:
+            counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+        else:
+            lowest = self._lowest()
+            if (count, key) <= lowest:
+                return
+            heapq.heapreplace(self._heap, (count, key))
+            del counts[lowest[1]]
+            counts[key] = count
+        if len(counts) >= self.size:
+            self.floor = self._lowest()[0]
+
+    def _lowest(self):
+        heap = self._heap
+        counts = self.counts
+        while counts[heap[0][1]] != heap[0][0]:
+            heapq.heapreplace(heap, (counts[heap[0][1]], heap[0][1]))
+        return heap[0]
+
+    def ranked(self, n=None):
+        """Return up to ``n`` ``(key, count)`` pairs, highest first."""
+        return heapq.nlargest(len(self.counts) if n is None else n, self.counts.items(), key=lambda item: (item[1], item[0]))
+
+    def export_state(self):
+        return {"size": self.size, "items": [[key, count] for key, count in self.ranked()]}
+
+    @classmethod
+    def from_state(cls, state, key=None):
+        """Restore a board exported by ``export_state``, with ``key`` mapping its saved keys to new ones."""
+        board = cls(state["size"])
+        for saved_key, count in state["items"]:
+            board.offer(key(saved_key) if key else saved_key, count)
+        return board
@@ -0,0 +1,106 @@
+import os
+import glob
+import hashlib
+from itertools import product
+
+LEXICONS_FOLDER = 'whatsapp_stat/files/lexicons'
+# One letter prefixes of Hebrew words: the, and, that, in, to, from
+HEBREW_PREFIXES = 'הושבלמ'
+MAX_PREFIXES = 2
+MIN_STEM_LENGTH = 2
+
+BAD_WORDS=[
+    ("זונה","הזונה","זונות","הזונות","בנזונה","זנות"),
+    ("סתום","טיפש","אידיוט","מפגר","דבע"),
+    ("זין","זיןן"),
+    ("מזדיין","מדיינת","זדיין","זיין","זיינתי","זיינו","הזדיינתי","תזדיינו","להזדיין"),
+    ("שרמוטה","שרמוטות"),]
+GOOD_WORDS = [
+    ("אוהב","מאוהב","אהבתי","אהבה","לאהוב","אהבה"),
+    ("תודה","תודות","להודות","מודה"),
+    ("שמח","שמחתי","לשמוח","לחייך","חיוך"),
+    ("טוב","טובה","לטובה","טובב","יופי"),
+]
+
+
+class Lexicon:
+    """A named category of word groups, like curses or good words.
+
+    Every group is a tuple of variants of one word and is counted under its first variant.
+    With ``prefixes=True`` a variant also matches with up to two Hebrew prefix letters in front
+    of it (ה/ו/ש/ב/ל/מ), so "ותודה" and "שבתודה" count as "תודה" without listing them.
+    """
+    def __init__(self, name, groups, prefixes=True):
+        self.name = name
+        self.groups = [tuple(group) for group in groups if group]
+        self.prefixes = prefixes
+
+    @classmethod
+    def from_file(cls, path):
+        """Read a lexicon file: one group per line, its variants separated by spaces or commas.
+
+        The file name is the name of the lexicon and lines starting with ``#`` are comments.
+        """
+        groups = []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    groups.append(tuple(line.replace(',', ' ').split()))
+        return cls(os.path.splitext(os.path.basename(path))[0], groups)
+
+    def forms(self):
+        """Yield every ``(form, label, exact)`` the lexicon matches, prefixed forms included."""
+        for group in self.groups:
+            label = group[0]
+            for variant in group:
+                yield variant, label, True
+                if self.prefixes and len(variant) >= MIN_STEM_LENGTH:
+                    for length in range(1, MAX_PREFIXES + 1):
+                        for prefix in product(HEBREW_PREFIXES, repeat=length):
+                            yield ''.join(prefix) + variant, label, False
+
+
+def default_lexicons():
+    return [Lexicon("Curses Words", BAD_WORDS), Lexicon("Good Words", GOOD_WORDS)]
+
+
+def load_lexicons(folder=LEXICONS_FOLDER):
+    """Return the built-in lexicons followed by one lexicon per ``.txt`` file in ``folder``.
+
+    A file named like a built-in lexicon replaces it.
+    """
+    lexicons = {lexicon.name: lexicon for lexicon in default_lexicons()}
+    for path in sorted(glob.glob(os.path.join(folder, '*.txt'))):
+        lexicon = Lexicon.from_file(path)
+        lexicons[lexicon.name] = lexicon
+    return list(lexicons.values())
+
+
+def compile_lexicons(lexicons, normalize=None):
+    """Compile lexicons into one dict from a word to the ``(lexicon, group)`` pairs it counts for.
+
+    Every form is expanded up front, so matching a word during parsing is a single dict lookup
+    however many lexicons and groups there are. Within a lexicon a word listed as a variant wins
+    over the same word read as a prefix and another variant. ``normalize`` is applied to every
+    form, to match words the way the tokenizer writes them.
+    """
+    matcher = {}
+    for lexicon in lexicons:
+        matches = {}
+        for form, label, exact in lexicon.forms():
+            if normalize:
+                form = normalize(form)
+            if form not in matches or (exact and not matches[form][1]):
+                matches[form] = (label, exact)
+        for form, (label, _) in matches.items():
+            matcher[form] = matcher.get(form, ()) + ((lexicon.name, label),)
+    return matcher
+
+
+def lexicon_signature(lexicons):
+    """Hash of the lexicon definitions, to tell whether saved counts were made with the same ones."""
+    hasher = hashlib.sha256()
+    for lexicon in lexicons:
+        hasher.update(repr((lexicon.name, lexicon.groups, lexicon.prefixes)).encode('utf-8'))
+    return hasher.hexdigest()
@@ -1,11 +1,137 @@
-from chat_plotter import ChatStatsPlotter
-from chat_stat import ChatStats
+import os
+import glob
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-group_name_list=['family',"yavne","brothers"]
-for group_name in group_name_list:
-    rel_path = f'whatsapp_stat/files/chat_{group_name}.txt'
-    abs_path = f'C:/Users/SmadarENB3/OneDrive/Desktop/ofek/programing/python/whatsapp_stat/files/chat_{group_name}.txt'
+from chat_plotter import PLOT_NAMES, ChatStatsPlotter, collectors_for
+from chat_stat import ChatStats, chat_name_of
+from instrumentation import Instrumentation
+from name_mapping import UNKNOWN_POLICIES
+from sessions import SESSION_GAP_MINUTES
+from tokenizer import Tokenizer
 
-    chat_stats = ChatStats(rel_path)
-    plotter = ChatStatsPlotter(chat_stats)
-    plotter.plot_all()
\ No newline at end of file
+DEFAULT_CHATS = 'whatsapp_stat/files/chat_*.txt'
+
+
+def find_chats(patterns):
+    """Return the chat exports matching ``patterns``, each a file, a folder of ``.txt`` exports or a glob."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.txt')
+        paths.extend(glob.glob(pattern))
+    # On Windows glob returns backslashes, while the chat name is taken after the last '/'
+    return sorted({path.replace(os.sep, '/') for path in paths})
+
+
+def process_chat(filepath, options):
+    """Parse and plot one chat. Runs in a worker process and never raises, so one bad chat can't stop the batch."""
+    start = time.perf_counter()
+    summary = {'chat': chat_name_of(filepath), 'path': filepath, 'messages': 0, 'rendered': 0, 'error': None}
+    run = Instrumentation(summary['chat'], profile=options['profile']) if options['report'] else None
+    try:
+        if run:
+            run.start()
+        chat_stats = ChatStats(filepath, use_checkpoint=options['use_checkpoint'], workers=options['parse_workers'],
+                               ngram_capacity=options['ngram_capacity'], unknown_senders=options['unknown_senders'],
+                               locale=options['locale'], instrumentation=run, session_gap=options['session_gap'],
+                               collectors=collectors_for(options['plots']), tokenizer=Tokenizer(final_letters=options['final_letters']))
+        summary['messages'] = chat_stats.message_count
+        plotter = ChatStatsPlotter(chat_stats, render_workers=options['render_workers'])
+        if options['output'] in ('png', 'both'):
+            # Only a --plots filter has to build something, the full set may be empty for an empty chat
+            summary['rendered'] = len(plotter.plot_all(None if options['plots'] == PLOT_NAMES else options['plots']))
+        if options['output'] in ('html', 'both'):
+            plotter.write_dashboard(plots=options['plots'])
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        if run:
+            run.stop()
+            run.save()
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def print_summary(summaries, seconds):
+    width = max([len(summary['chat']) for summary in summaries] + [4])
+    print(f"\n{'chat':<{width}}  {'messages':>9}  {'rendered':>8}  {'seconds':>8}  status")
+    for summary in summaries:
+        status = f"failed ({summary['error']})" if summary['error'] else 'ok'
+        print(f"{summary['chat']:<{width}}  {summary['messages']:>9}  {summary['rendered']:>8}  {summary['seconds']:>8.2f}  {status}")
+    failed = sum(1 for summary in summaries if summary['error'])
+    print(f"{len(summaries)} chats, {sum(summary['messages'] for summary in summaries)} messages, "
+          f"{failed} failed, {seconds:.2f}s in total")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse and plot WhatsApp chat exports, several chats at a time.")
+    parser.add_argument('chats', nargs='*', default=[DEFAULT_CHATS], help=f"export files, folders or globs (default {DEFAULT_CHATS})")
+    parser.add_argument('--jobs', type=int, default=min(4, os.cpu_count() or 1), help="chats processed at the same time")
+    parser.add_argument('--parse-workers', type=int, default=1, help="processes parsing each chat")
+    parser.add_argument('--render-workers', type=int, default=1, help="processes rendering the plots of each chat")
+    parser.add_argument('--unknown-senders', choices=UNKNOWN_POLICIES, default='keep',
+                        help="how to name senders missing from the name files, 'ask' only works with --jobs 1")
+    parser.add_argument('--ngram-capacity', type=int, default=None, help="keep only about this many phrases per chat")
+    parser.add_argument('--locale', default='auto')
+    parser.add_argument('--plots', nargs='+', choices=PLOT_NAMES, default=PLOT_NAMES,
+                        help="plot only these, and count only the statistics they need")
+    parser.add_argument('--session-gap', type=int, default=SESSION_GAP_MINUTES,
+                        help="minutes of silence that end a conversation session")
+    parser.add_argument('--final-letters', action='store_true', help="count words ending in ךםןףץ with the regular letters")
+    parser.add_argument('--output', choices=('png', 'html', 'both'), default='png',
+                        help="image files per chart, one interactive HTML dashboard per chat, or both")
+    parser.add_argument('--no-checkpoint', action='store_true', help="parse every chat from the start")
+    parser.add_argument('--report', action='store_true', help="write an instrumentation report per chat")
+    parser.add_argument('--profile', action='store_true', help="include a cProfile capture in the reports")
+    args = parser.parse_args(argv)
+
+    paths = find_chats(args.chats)
+    if not paths:
+        print(f"No chat exports found in {' '.join(args.chats)}")
+        return 1
+    if args.unknown_senders == 'ask' and args.jobs > 1:
+        print("Can't ask for names while chats run in parallel, keeping the raw names of unknown senders.")
+        args.unknown_senders = 'keep'
+    options = {
+        'use_checkpoint': not args.no_checkpoint,
+        'parse_workers': args.parse_workers,
+        'render_workers': args.render_workers,
+        'ngram_capacity': args.ngram_capacity,
+        'unknown_senders': args.unknown_senders,
+        'locale': args.locale,
+        'session_gap': args.session_gap,
+        'final_letters': args.final_letters,
+        'plots': args.plots,
+        'output': args.output,
+        'report': args.report or args.profile,
+        'profile': args.profile,
+    }
+
+    start = time.perf_counter()
+    if args.jobs > 1 and len(paths) > 1:
+        # Every chat goes through parsing and plotting in its own worker, so one chat's parsing
+        # overlaps with another chat's rendering. The biggest exports go first to finish sooner.
+        paths.sort(key=os.path.getsize, reverse=True)
+        summaries = []
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(paths))) as pool:
+            futures = {pool.submit(process_chat, path, options): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    # The worker itself died, e.g. ran out of memory
+                    summaries.append({'chat': chat_name_of(futures[future]), 'path': futures[future], 'messages': 0,
+                                      'rendered': 0, 'seconds': 0.0, 'error': f"{type(e).__name__}: {e}"})
+        summaries.sort(key=lambda summary: summary['chat'])
+    else:
+        summaries = [process_chat(path, options) for path in paths]
+    print_summary(summaries, time.perf_counter() - start)
+    return 1 if any(summary['error'] for summary in summaries) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+from array import array
+from datetime import date as date_type
+
+import numpy as np
+import pandas as pd
+
+EPOCH_ORDINAL = date_type(1970, 1, 1).toordinal()
+MINUTES_PER_DAY = 24 * 60
+
+
+class MessageTable:
+    """Columnar store of the parsed messages.
+
+    Every message is one row: its timestamp in minutes since the epoch, the code of its sender
+    and the byte range of its text in the chat file. The rows live in flat arrays instead of one
+    dict per message, and the distributions are computed over whole columns at once.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.persons = []
+        self._person_codes = {}
+        self._minutes = array('q')
+        self._person_column = array('i')
+        self._text_start = array('q')
+        self._text_end = array('q')
+
+    def __len__(self):
+        return len(self._minutes)
+
+    def append(self, date, time, person, text_start, text_end):
+        code = self._person_codes.get(person)
+        if code is None:
+            code = self._person_codes[person] = len(self.persons)
+            self.persons.append(person)
+        self._minutes.append((date.toordinal() - EPOCH_ORDINAL) * MINUTES_PER_DAY + time.hour * 60 + time.minute)
+        self._person_column.append(code)
+        self._text_start.append(text_start)
+        self._text_end.append(text_end)
+
+    def extend_text(self, text_end):
+        """Grow the text of the last message to include a continuation line."""
+        self._text_end[-1] = text_end
+
+    @property
+    def minutes(self):
+        return np.frombuffer(self._minutes, dtype=np.int64)
+
+    @property
+    def timestamps(self):
+        return self.minutes.astype('datetime64[m]')
+
+    @property
+    def person_codes(self):
+        return np.frombuffer(self._person_column, dtype=np.int32)
+
+    def message(self, index):
+        """Read the text of one message back from the chat file, with its lines joined by spaces."""
+        with open(self.filepath, 'rb') as file:
+            file.seek(self._text_start[index])
+            text = file.read(self._text_end[index] - self._text_start[index]).decode('utf-8')
+        if text.endswith('\n'):
+            text = text[:-1]
+        return ' '.join(line.strip() for line in text.split('\n'))
+
+    def first_lines(self, rows):
+        """Yield the first line of the text of each of ``rows``, the part the word counts are taken from."""
+        with open(self.filepath, 'rb') as file:
+            for row in rows:
+                file.seek(self._text_start[row])
+                text = file.read(self._text_end[row] - self._text_start[row])
+                yield text.split(b'\n', 1)[0].decode('utf-8').strip()
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'timestamp': self.timestamps,
+            'person': pd.Categorical.from_codes(self.person_codes, categories=self.persons),
+            'text_start': np.frombuffer(self._text_start, dtype=np.int64),
+            'text_end': np.frombuffer(self._text_end, dtype=np.int64),
+        })
+
+    def _column(self, name):
+        days = self.minutes // MINUTES_PER_DAY
+        if name == 'hour':
+            return self.minutes // 60 % 24
+        if name == 'month':
+            return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+        if name == 'year':
+            return days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+        if name == 'date':
+            return days
+        if name == 'name':
+            return self.person_codes
+        raise ValueError(f"Unknown distribution '{name}'")
+
+    def counts(self, name):
+        """Return the keys and counts of one distribution, in the order the keys first appear."""
+        if not len(self):
+            return [], []
+        values, first_rows, counts = np.unique(self._column(name), return_index=True, return_counts=True)
+        order = np.argsort(first_rows)
+        keys = values[order].tolist()
+        if name == 'date':
+            keys = [date_type.fromordinal(day + EPOCH_ORDINAL) for day in keys]
+        elif name == 'name':
+            keys = [self.persons[code] for code in keys]
+        return keys, counts[order].tolist()
+
+    def distribution(self, name, column):
+        keys, counts = self.counts(name)
+        return pd.DataFrame({column: keys, 'Count': counts})
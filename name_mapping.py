@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+
+NAMES_FOLDER = 'whatsapp_stat/files/names'
+UNKNOWN_POLICIES = ('ask', 'keep', 'placeholder')
+
+
+class NameMapping:
+    """Persistent mapping from the raw sender names of one chat to the names shown in the stats.
+
+    The mapping is loaded once from ``<folder>/<chat_name>.json`` and looked up like a dict.
+    A sender that is not in the file is resolved by the ``unknown`` policy:
+
+    - ``'ask'`` prompts for a name like before (an empty answer keeps the raw name), and falls
+      back to ``'keep'`` when there is no terminal to ask on. That name is only used for the
+      current run and not saved, so the next run with a terminal asks for it.
+    - ``'keep'`` uses the raw name.
+    - ``'placeholder'`` uses ``'Unknown <n>'``.
+
+    Mapping a sender to ``'dont'`` leaves their messages out of the stats.
+    """
+    def __init__(self, chat_name, unknown='ask', folder=NAMES_FOLDER):
+        if unknown not in UNKNOWN_POLICIES:
+            raise ValueError(f"unknown must be one of {UNKNOWN_POLICIES}, not '{unknown}'")
+        self.path = os.path.join(folder, f'{chat_name}.json')
+        self.unknown = unknown
+        self.mapping = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.mapping = json.load(file)
+        self.changed = False
+        # Raw names kept for this run only because there was no terminal to ask on
+        self.unresolved = set()
+
+    def resolve(self, person):
+        """Return the name for a raw sender name, resolving and remembering it if it is new."""
+        name = self.mapping.get(person)
+        if name is None:
+            name = self.mapping[person] = self._resolve_unknown(person)
+            self.changed = True
+        return name
+
+    def _resolve_unknown(self, person):
+        if self.unknown == 'ask':
+            if sys.stdin is not None and sys.stdin.isatty():
+                return input(f"Enter the name to replace '{person}': ") or person
+            self.unresolved.add(person)
+            return person
+        if self.unknown == 'placeholder':
+            return f"Unknown {len(self.mapping) + 1}"
+        return person
+
+    def prefill(self, senders):
+        """Resolve all ``senders`` up front, so parsing never has to stop for a new name."""
+        for person in senders:
+            self.resolve(person)
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({person: name for person, name in self.mapping.items() if person not in self.unresolved}, file,
+                      ensure_ascii=False, indent=4)
+        os.replace(self.path + '.tmp', self.path)
+        self.changed = False
+
+
+if __name__ == '__main__':
+    # Write the name file of each given chat from a scan of its senders, ready to be edited by hand
+    from chat_stat import chat_name_of, scan_senders
+
+    for chat_path in sys.argv[1:]:
+        names = NameMapping(chat_name_of(chat_path), unknown='keep')
+        names.prefill(scan_senders(chat_path))
+        names.save()
+        print(f"{names.path}: {len(names.mapping)} senders")
@@ -0,0 +1,427 @@
+import heapq
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from leaderboard import Leaderboard
+
+ID_BITS = 21
+MAX_WORD_ID = (1 << ID_BITS) - 1
+# A (phrase row, person code) pair is packed as row << PERSON_BITS | code
+PERSON_BITS = 20
+PERSON_MASK = (1 << PERSON_BITS) - 1
+# Counted pairs waiting to be summed before they are added to the sparse person counts
+MIN_PENDING_PAIRS = 1 << 20
+
+
+class TokenVocabulary:
+    """Interns every distinct word to a small integer id."""
+    def __init__(self):
+        self.words = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def intern(self, word):
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            if word_id > MAX_WORD_ID:
+                raise OverflowError(f"More than {MAX_WORD_ID + 1} distinct words can't be packed into n-gram keys")
+            self.words.append(word)
+        return word_id
+
+    def intern_all(self, words):
+        ids = self.ids
+        word_ids = []
+        for word in words:
+            word_id = ids.get(word)
+            if word_id is None:
+                word_id = self.intern(word)
+            word_ids.append(word_id)
+        return word_ids
+
+    def merge_words(self, words):
+        """Intern the words of another vocabulary and return the id each of them gets here.
+
+        Returns None when they all keep their ids, which is the case when this vocabulary is
+        empty or the start of the other one, as when restoring a checkpoint.
+        """
+        known = len(self.words)
+        if self.words != words[:known]:
+            return np.array(self.intern_all(words), dtype=np.int64)
+        if len(words) > MAX_WORD_ID + 1:
+            raise OverflowError(f"More than {MAX_WORD_ID + 1} distinct words can't be packed into n-gram keys")
+        self.ids.update(zip(words[known:], range(known, len(words))))
+        self.words.extend(words[known:])
+        return None
+
+
+class _PackedNGrams(Mapping):
+    """Packs the word ids of an n-gram into one integer key."""
+    def _pack(self, ids):
+        key = 0
+        for word_id in ids:
+            key = (key << ID_BITS) | word_id
+        return key
+
+    def _unpack(self, key):
+        ids = []
+        for _ in range(self.n):
+            ids.append(key & MAX_WORD_ID)
+            key >>= ID_BITS
+        return ids[::-1]
+
+    def _key_of(self, phrase):
+        """Return the key of an already seen phrase, or None."""
+        ids = []
+        for word in phrase.split(' '):
+            word_id = self.vocabulary.ids.get(word)
+            if word_id is None:
+                return None
+            ids.append(word_id)
+        return self._pack(ids) if len(ids) == self.n else None
+
+    def _remap_keys(self, keys, word_ids):
+        """Translate an array of keys packed with the ids of another vocabulary, see ``TokenVocabulary.merge_words``."""
+        if word_ids is None:
+            return keys
+        remapped = np.zeros(len(keys), dtype=np.int64)
+        for position in range(self.n):
+            shift = ID_BITS * (self.n - 1 - position)
+            remapped |= word_ids[(keys >> shift) & MAX_WORD_ID] << shift
+        return remapped
+
+    def _packed_ngrams(self, ids):
+        if self.n == 2:
+            return [(a << ID_BITS) | b for a, b in zip(ids, ids[1:])]
+        if self.n == 3:
+            return [(((a << ID_BITS) | b) << ID_BITS) | c for a, b, c in zip(ids, ids[1:], ids[2:])]
+        return [self._pack(gram) for gram in zip(*(ids[i:] for i in range(self.n)))]
+
+
+class NGramCounter(_PackedNGrams):
+    """Counts n-grams of interned word ids.
+
+    Every n-gram is packed into one int64 key that maps to a row, and the total count of each
+    row lives in a flat array column instead of one dict per phrase. Most phrases are only ever
+    used by one or two people, so the per-person counts are sparse: sorted arrays of packed
+    ``(row, person code)`` pairs and their counts. Every counted n-gram only appends its pair to
+    a pending array, which numpy sums into the sorted ones once it grows as large as them.
+    Reading it like the old ``phrase -> {person: count, 'count': total}`` dict still works,
+    but nothing is inserted on lookup. The most common phrases are kept in a ``Leaderboard``
+    as they are counted, keyed by the negated row so ties go to the phrase seen first.
+    """
+    def __init__(self, n, vocabulary):
+        self.n = n
+        self.vocabulary = vocabulary
+        # key -> row, None after merging arrays until it is needed again
+        self._rows = {}
+        self._keys = array('q')
+        self._totals = array('q')
+        self._persons = []
+        self._person_codes = {}
+        self._pending_pairs = array('q')
+        self._pairs = np.zeros(0, dtype=np.int64)
+        self._pair_counts = np.zeros(0, dtype=np.int64)
+        self.leaderboard = Leaderboard()
+
+    def _row_index(self):
+        if self._rows is None:
+            self._rows = dict(zip(self._keys, range(len(self._keys))))
+        return self._rows
+
+    def _row(self, key):
+        rows = self._row_index()
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = len(self._keys)
+            self._keys.append(key)
+            self._totals.append(0)
+        return row
+
+    def _person_code(self, person):
+        code = self._person_codes.get(person)
+        if code is None:
+            code = self._person_codes[person] = len(self._persons)
+            self._persons.append(person)
+        return code
+
+    def add(self, ids, person):
+        """Count every n-gram in the word id sequence ``ids`` for ``person``."""
+        rows = self._row_index()
+        keys = self._keys
+        totals = self._totals
+        pairs = self._pending_pairs
+        leaderboard = self.leaderboard
+        floor = leaderboard.floor
+        code = self._person_code(person)
+        for key in self._packed_ngrams(ids):
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = len(keys)
+                keys.append(key)
+                totals.append(0)
+            total = totals[row] = totals[row] + 1
+            if total >= floor:
+                leaderboard.offer(-row, total)
+                floor = leaderboard.floor
+            pairs.append(row << PERSON_BITS | code)
+        if len(pairs) >= max(MIN_PENDING_PAIRS, len(self._pairs)):
+            self._sum_pending()
+
+    def _sum_pending(self):
+        if self._pending_pairs:
+            pairs, counts = np.unique(np.frombuffer(self._pending_pairs, dtype=np.int64), return_counts=True)
+            self._pending_pairs = array('q')
+            self._add_pairs(pairs, counts)
+
+    def _add_pairs(self, pairs, counts):
+        """Add the counts of packed pairs to the sorted person counts."""
+        if len(self._pairs):
+            pairs, inverse = np.unique(np.concatenate([self._pairs, pairs]), return_inverse=True)
+            counts = np.bincount(inverse, np.concatenate([self._pair_counts, counts]), len(pairs))
+        self._pairs = pairs.astype(np.int64)
+        self._pair_counts = counts.astype(np.int64)
+
+    def person_counts(self):
+        """Return the rows, person codes and counts of every phrase and person that used it, by row."""
+        self._sum_pending()
+        return self._pairs >> PERSON_BITS, self._pairs & PERSON_MASK, self._pair_counts
+
+    def phrase(self, row):
+        return ' '.join(self.vocabulary.words[word_id] for word_id in self._unpack(self._keys[row]))
+
+    def _row_of(self, phrase):
+        key = self._key_of(phrase)
+        return None if key is None else self._row_index().get(key)
+
+    def __getitem__(self, phrase):
+        row = self._row_of(phrase)
+        if row is None:
+            raise KeyError(phrase)
+        self._sum_pending()
+        start, stop = np.searchsorted(self._pairs, [row << PERSON_BITS, (row + 1) << PERSON_BITS])
+        counts = {self._persons[pair & PERSON_MASK]: int(count)
+                  for pair, count in zip(self._pairs[start:stop].tolist(), self._pair_counts[start:stop].tolist())}
+        counts['count'] = self._totals[row]
+        return counts
+
+    def __iter__(self):
+        for row in range(len(self._keys)):
+            yield self.phrase(row)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def total(self):
+        """Number of n-grams counted, repeats included."""
+        return sum(self._totals)
+
+    def most_common(self, n=None):
+        """Return the ``n`` most frequent ``(phrase, count)`` pairs, ties in the order they first appeared.
+
+        Up to the size of the leaderboard they are read from it, without looking at the other phrases.
+        """
+        if n is not None and n <= self.leaderboard.size:
+            return [(self.phrase(-row), count) for row, count in self.leaderboard.ranked(n)]
+        totals = np.frombuffer(self._totals, dtype=np.int64)
+        order = np.argsort(-totals, kind='stable')[:n]
+        return [(self.phrase(row), int(totals[row])) for row in order]
+
+    def export_state(self):
+        """Return the counts in a compact, vocabulary independent and JSON friendly form."""
+        rows, codes, counts = self.person_counts()
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self._persons) + 1)).tolist()
+        persons = {}
+        for code, person in enumerate(self._persons):
+            selected = order[bounds[code]:bounds[code + 1]]
+            persons[person] = [rows[selected].tolist(), counts[selected].tolist()]
+        return {
+            "phrases": [self.phrase(row) for row in range(len(self._keys))],
+            "totals": self._totals.tolist(),
+            "persons": persons,
+            "leaderboard": self.leaderboard.export_state(),
+        }
+
+    def merge_state(self, state):
+        """Add counts exported by ``export_state`` to this counter.
+
+        Into an empty counter the saved leaderboard is taken as is, otherwise every merged phrase
+        is offered to the leaderboard with its new total.
+        """
+        empty = not self._keys
+        rows = [self._row(self._pack(self.vocabulary.intern_all(phrase.split(' ')))) for phrase in state["phrases"]]
+        for row, total in zip(rows, state["totals"]):
+            self._totals[row] += total
+        if empty and "leaderboard" in state:
+            self.leaderboard = Leaderboard.from_state(state["leaderboard"], lambda saved_row: -rows[-saved_row])
+        else:
+            leaderboard = self.leaderboard
+            for row in rows:
+                if self._totals[row] >= leaderboard.floor:
+                    leaderboard.offer(-row, self._totals[row])
+        rows = np.array(rows, dtype=np.int64)
+        for person, (state_rows, counts) in state["persons"].items():
+            pairs = rows[np.array(state_rows, dtype=np.int64)] << PERSON_BITS | self._person_code(person)
+            order = np.argsort(pairs)
+            self._add_pairs(pairs[order], np.array(counts, dtype=np.int64)[order])
+
+    def export_arrays(self):
+        """Return the counts as numpy arrays of keys packed with the vocabulary ids.
+
+        Nothing is turned into phrase strings, so this is what checkpoints and parallel workers
+        use; the vocabulary has to go along with it for ``merge_arrays``.
+        """
+        self._sum_pending()
+        return {
+            "keys": np.array(self._keys, dtype=np.int64),
+            "totals": np.array(self._totals, dtype=np.int64),
+            "pairs": self._pairs,
+            "pair_counts": self._pair_counts,
+            "persons": list(self._persons),
+            "leaderboard": self.leaderboard.export_state(),
+        }
+
+    def merge_arrays(self, state, word_ids=None):
+        """Add counts exported by ``export_arrays``, their word ids translated by ``word_ids`` if not None.
+
+        The merged keys are looked up among the known ones by sorting, and the counts are added
+        as arrays, so nothing is done per phrase in Python. The leaderboard is handled like in
+        ``merge_state``.
+        """
+        empty = not self._keys
+        keys = self._remap_keys(state["keys"], word_ids)
+        known = np.array(self._keys, dtype=np.int64)
+        merged_rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(known):
+            order = np.argsort(known)
+            positions = np.minimum(np.searchsorted(known[order], keys), len(known) - 1)
+            found = known[order[positions]] == keys
+            merged_rows[found] = order[positions[found]]
+        # The new keys get the next rows
+        new = merged_rows < 0
+        merged_rows[new] = np.arange(len(known), len(known) + np.count_nonzero(new))
+        self._keys.frombytes(keys[new].tobytes())
+        self._totals.frombytes(bytes(8 * np.count_nonzero(new)))
+        self._rows = None
+        totals = np.frombuffer(self._totals, dtype=np.int64)
+        totals[merged_rows] += state["totals"]
+        if empty:
+            self.leaderboard = Leaderboard.from_state(state["leaderboard"], lambda saved_row: -int(merged_rows[-saved_row]))
+        else:
+            leaderboard = self.leaderboard
+            for row in merged_rows[totals[merged_rows] >= leaderboard.floor].tolist():
+                if totals[row] >= leaderboard.floor:
+                    leaderboard.offer(-row, int(totals[row]))
+        codes = np.array([self._person_code(person) for person in state["persons"]], dtype=np.int64)
+        pairs = merged_rows[state["pairs"] >> PERSON_BITS] << PERSON_BITS | codes[state["pairs"] & PERSON_MASK]
+        order = np.argsort(pairs)
+        self._add_pairs(pairs[order], state["pair_counts"][order])
+
+
+class MisraGriesCounter(_PackedNGrams):
+    """Approximate n-gram counter that keeps a bounded number of phrases (Misra-Gries).
+
+    Whenever more than ``2 * capacity`` phrases are tracked, the ``capacity + 1``-th largest
+    count is subtracted from every phrase and the ones that drop to zero are forgotten. Each
+    reported count is at most ``error_bound`` below the true count, and ``error_bound`` never
+    exceeds ``total / (capacity + 1)``, so the top of the ranking stays accurate while memory
+    stays constant. Only the total of each phrase is kept, per-person counts would have no such
+    bound, so reading a phrase gives just its ``'count'``.
+    """
+    def __init__(self, n, vocabulary, capacity):
+        self.n = n
+        self.vocabulary = vocabulary
+        self.capacity = capacity
+        self.total = 0
+        self.error_bound = 0
+        self._counts = {}
+
+    def add(self, ids, person, count=1):
+        """Count every n-gram in the word id sequence ``ids``; ``person`` is not kept."""
+        counts = self._counts
+        for key in self._packed_ngrams(ids):
+            self.total += count
+            counts[key] = counts.get(key, 0) + count
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        """Subtract the ``capacity + 1``-th largest count from all phrases and drop the ones left at zero."""
+        if len(self._counts) <= self.capacity:
+            return
+        decrement = heapq.nlargest(self.capacity + 1, self._counts.values())[-1]
+        self.error_bound += decrement
+        self._counts = {key: count - decrement for key, count in self._counts.items() if count > decrement}
+
+    def phrase(self, key):
+        return ' '.join(self.vocabulary.words[word_id] for word_id in self._unpack(key))
+
+    def __getitem__(self, phrase):
+        key = self._key_of(phrase)
+        if key not in self._counts:
+            raise KeyError(phrase)
+        return {'count': self._counts[key]}
+
+    def __iter__(self):
+        for key in self._counts:
+            yield self.phrase(key)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def most_common(self, n=None):
+        """Return the ``n`` highest ``(phrase, estimated count)`` pairs."""
+        if n is None:
+            ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        else:
+            ranked = heapq.nlargest(n, self._counts.items(), key=lambda item: item[1])
+        return [(self.phrase(key), count) for key, count in ranked]
+
+    def most_common_with_error(self, n=None):
+        """Return the ``n`` highest ``(phrase, lowest possible count, highest possible count)`` triples."""
+        return [(phrase, count, count + self.error_bound) for phrase, count in self.most_common(n)]
+
+    def export_state(self):
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "error_bound": self.error_bound,
+            "items": [[self.phrase(key), count] for key, count in self._counts.items()],
+        }
+
+    def merge_state(self, state):
+        """Merge another summary into this one; the error bounds of both sides add up.
+
+        It is pruned like after ``add``, so restoring a saved summary gives it back unchanged.
+        """
+        for phrase, count, *_ in state["items"]:
+            key = self._pack(self.vocabulary.intern_all(phrase.split(' ')))
+            self._counts[key] = self._counts.get(key, 0) + count
+        self.total += state["total"]
+        self.error_bound += state["error_bound"]
+        if len(self._counts) > 2 * self.capacity:
+            self._prune()
+
+    def export_arrays(self):
+        """Return the summary with its keys as a numpy array, like ``NGramCounter.export_arrays``."""
+        return {
+            "total": self.total,
+            "error_bound": self.error_bound,
+            "keys": np.array(list(self._counts), dtype=np.int64),
+            "counts": np.array(list(self._counts.values()), dtype=np.int64),
+        }
+
+    def merge_arrays(self, state, word_ids=None):
+        counts = self._counts
+        for key, count in zip(self._remap_keys(state["keys"], word_ids).tolist(), state["counts"].tolist()):
+            counts[key] = counts.get(key, 0) + count
+        self.total += state["total"]
+        self.error_bound += state["error_bound"]
+        if len(self._counts) > 2 * self.capacity:
+            self._prune()
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import NULL_INSTRUMENTATION
+
+import plotly
+import plotly.graph_objects as go
+
+MANIFEST_NAME = '.plot_manifest.json'
+
+
+def _export_figure(path, fig_dict):
+    """Render one figure inside a worker process and return how long it took."""
+    start = time.perf_counter()
+    go.Figure(fig_dict).write_image(path)
+    return time.perf_counter() - start
+
+
+def figure_hash(fig):
+    """Hash everything that ends up in the image: the plotted data, the layout and the plotly version."""
+    return hashlib.sha256(f"{plotly.__version__}\n{fig.to_json()}".encode('utf-8')).hexdigest()
+
+
+class PlotRenderer:
+    """Export built figures to image files.
+
+    With ``workers > 1`` the figures are rendered concurrently on a process pool. Every worker
+    keeps its own Kaleido process alive between figures, so up to ``workers`` figures are
+    rasterized at the same time instead of one after another.
+
+    When ``plots_folder`` is given, a manifest of figure hashes is kept there and figures whose
+    hash matches the already existing image are not rendered again.
+    """
+    def __init__(self, workers=1, plots_folder=None, instrumentation=NULL_INSTRUMENTATION):
+        self.workers = workers
+        self.instrumentation = instrumentation
+        self.manifest_path = os.path.join(plots_folder, MANIFEST_NAME) if plots_folder else None
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        return {}
+
+    def _save_manifest(self):
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=4)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def _manifest_key(self, path):
+        return os.path.relpath(path, os.path.dirname(self.manifest_path)).replace(os.sep, '/')
+
+    def render(self, figures):
+        """Write every changed ``(path, fig)`` pair and return the ``(path, seconds)`` it took for each."""
+        start = time.perf_counter()
+        hashes = {}
+        if self.manifest_path:
+            changed = []
+            for path, fig in figures:
+                hashes[path] = figure_hash(fig)
+                if self.manifest.get(self._manifest_key(path)) != hashes[path] or not os.path.exists(path):
+                    changed.append((path, fig))
+            skipped = len(figures) - len(changed)
+            figures = changed
+        else:
+            skipped = 0
+
+        for path, _ in figures:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if self.workers > 1 and len(figures) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(figures))) as pool:
+                futures = [(path, pool.submit(_export_figure, path, fig.to_dict())) for path, fig in figures]
+                timings = [(path, future.result()) for path, future in futures]
+        else:
+            timings = []
+            for path, fig in figures:
+                figure_start = time.perf_counter()
+                fig.write_image(path)
+                timings.append((path, time.perf_counter() - figure_start))
+
+        for path, seconds in timings:
+            print(f"Rendered {path} in {seconds:.2f}s")
+        if self.instrumentation.enabled:
+            self.instrumentation.count('figures_rendered', len(timings))
+            self.instrumentation.count('figures_skipped', skipped)
+            self.instrumentation.count('bytes_written', sum(os.path.getsize(path) for path, _ in timings))
+        if skipped:
+            print(f"Skipped {skipped} unchanged figure(s)")
+        if len(figures) > 1:
+            print(f"Rendered {len(figures)} figures in {time.perf_counter() - start:.2f}s using {self.workers} worker(s)")
+
+        if self.manifest_path and timings:
+            for path, _ in timings:
+                self.manifest[self._manifest_key(path)] = hashes[path]
+            self._save_manifest()
+        return timings
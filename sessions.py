@@ -0,0 +1,205 @@
+from collections import Counter, defaultdict
+
+# Minutes of silence after which the next message starts a new conversation session
+SESSION_GAP_MINUTES = 60
+# Counts are bucketed by powers of two: 0, 1, 2-3, 4-7, ... and the last bucket is open ended,
+# for latencies that is 2^14 minutes (about 11 days) or more
+LOG_BUCKETS = 16
+
+
+def log_bucket(value):
+    return min(max(value, 0).bit_length(), LOG_BUCKETS - 1)
+
+
+def bucket_bounds(bucket):
+    """Return the smallest and largest value of a bucket, with ``None`` as the top of the last one."""
+    if bucket == 0:
+        return 0, 0
+    low = 1 << (bucket - 1)
+    return low, None if bucket == LOG_BUCKETS - 1 else (low << 1) - 1
+
+
+def _format_minutes(minutes):
+    if minutes < 60:
+        return f"{minutes}m"
+    if minutes < 24 * 60:
+        return f"{minutes // 60}h"
+    return f"{minutes // (24 * 60)}d"
+
+
+def bucket_label(bucket, minutes=True):
+    low, high = bucket_bounds(bucket)
+    text = _format_minutes if minutes else str
+    if high is None:
+        return f"{text(low)}+"
+    return text(low) if low == high else f"{text(low)}-{text(high)}"
+
+
+def median_bucket(counts):
+    """Return the bucket holding the median of a list of bucket counts, or ``None`` if it is empty."""
+    half = (sum(counts) + 1) // 2
+    total = 0
+    for bucket, count in enumerate(counts):
+        total += count
+        if half and total >= half:
+            return bucket
+    return None
+
+
+def _session_state(session):
+    return None if session is None else [session[0], session[1], session[2], sorted(session[3])]
+
+
+def _session_from_state(state):
+    return None if state is None else [state[0], state[1], state[2], set(state[3])]
+
+
+class SessionTracker:
+    """Reply latencies and conversation sessions, counted in one pass over the messages.
+
+    A reply is a message from someone other than the sender of the message before it, and its
+    latency is the time between the two. Latencies are counted per ``(replier, replied to)`` pair
+    in logarithmic buckets. A session is a run of messages without ``gap`` minutes of silence
+    between them. Sessions are counted by how many messages and participants they had. Only the
+    last message and the open session are remembered, so the state does not grow with the chat.
+
+    With ``continues=True`` the messages may go on from earlier ones counted elsewhere, like a
+    chunk of a file parsed on its own. The first session is then held back in ``opening`` until
+    ``join`` can tell whether it continues the session before it.
+    """
+    def __init__(self, gap=SESSION_GAP_MINUTES, continues=False):
+        self.gap = gap
+        self.continues = continues
+        # (replier, replied to) -> reply count per latency bucket
+        self.reply_latency = {}
+        # messages in a session -> sessions, participants in a session -> sessions
+        self.session_messages = defaultdict(int)
+        self.session_participants = defaultdict(int)
+        # (minute, person) of the first and the last message
+        self.first = None
+        self.last = None
+        # Sessions still open, as [start minute, end minute, messages, participants]
+        self.opening = None
+        self.current = None
+
+    def add(self, minute, person):
+        """Count one message sent at ``minute`` since the epoch."""
+        last = self.last
+        if last is None:
+            self.first = (minute, person)
+        elif person != last[1]:
+            self._reply(person, last[1], minute - last[0])
+        session = self.current
+        if session is None or minute - session[1] > self.gap:
+            if session is not None:
+                self._close(session)
+            session = self.current = [minute, minute, 0, set()]
+        elif minute > session[1]:
+            session[1] = minute
+        session[2] += 1
+        session[3].add(person)
+        self.last = (minute, person)
+
+    def _reply(self, replier, replied_to, minutes):
+        buckets = self.reply_latency.get((replier, replied_to))
+        if buckets is None:
+            buckets = self.reply_latency[replier, replied_to] = [0] * LOG_BUCKETS
+        buckets[log_bucket(minutes)] += 1
+
+    def _close(self, session):
+        if self.continues:
+            self.opening = session
+            self.continues = False
+            return
+        self.session_messages[session[2]] += 1
+        self.session_participants[len(session[3])] += 1
+
+    def join(self, other):
+        """Add the counts of ``other``, a tracker of the messages right after these ones.
+
+        The reply across the seam is counted and the session open at the seam goes on into
+        ``other`` when the silence between them is short enough, so parsing a file in chunks and
+        joining them in order gives the same counts as one pass.
+        """
+        if other.first is None:
+            return self
+        self.merge_state(other.export_state(), ended=False)
+        if self.last is not None and other.first[1] != self.last[1]:
+            self._reply(other.first[1], self.last[1], other.first[0] - self.last[0])
+        head = list(other.opening or other.current)
+        if self.current is not None:
+            if head[0] - self.current[1] <= self.gap:
+                head = [self.current[0], max(self.current[1], head[1]), self.current[2] + head[2], self.current[3] | head[3]]
+            else:
+                self._close(self.current)
+        if other.opening is not None:
+            self._close(head)
+            self.current = list(other.current)
+        else:
+            self.current = head
+        self.first = self.first or other.first
+        self.last = other.last
+        return self
+
+    def latency_counts(self):
+        """Return the reply counts per latency bucket as replier -> replied to -> bucket counts."""
+        counts = defaultdict(dict)
+        for (replier, replied_to), buckets in self.reply_latency.items():
+            counts[replier][replied_to] = list(buckets)
+        return dict(counts)
+
+    def session_counts(self):
+        """Return the sessions by message count and by participant count, the open ones included."""
+        messages, participants = Counter(self.session_messages), Counter(self.session_participants)
+        for session in (self.opening, self.current):
+            if session is not None:
+                messages[session[2]] += 1
+                participants[len(session[3])] += 1
+        return messages, participants
+
+    def export_state(self):
+        """Return the counts and the open sessions as plain JSON-friendly values."""
+        return {
+            "gap": self.gap,
+            "reply_latency": self.latency_counts(),
+            "session_messages": dict(self.session_messages),
+            "session_participants": dict(self.session_participants),
+            "first": self.first,
+            "last": self.last,
+            "opening": _session_state(self.opening),
+            "current": _session_state(self.current),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Restore a tracker exported by ``export_state`` so it can go on counting where it stopped."""
+        tracker = cls(state["gap"])
+        tracker.merge_state(state, ended=False)
+        tracker.first = tuple(state["first"]) if state["first"] else None
+        tracker.last = tuple(state["last"]) if state["last"] else None
+        tracker.opening = _session_from_state(state["opening"])
+        tracker.current = _session_from_state(state["current"])
+        return tracker
+
+    def merge_state(self, state, ended=True):
+        """Add the counts exported by ``export_state``.
+
+        With ``ended`` the open sessions of ``state`` are counted as finished ones, which is right
+        for unrelated messages like another chat.
+        """
+        if state["gap"] != self.gap:
+            raise ValueError(f"Can't merge sessions split by a {state['gap']} minute gap into sessions split by {self.gap}")
+        for replier, counts in state["reply_latency"].items():
+            for replied_to, buckets in counts.items():
+                target = self.reply_latency.setdefault((replier, replied_to), [0] * LOG_BUCKETS)
+                for bucket, count in enumerate(buckets):
+                    target[bucket] += count
+        for size, count in state["session_messages"].items():
+            self.session_messages[int(size)] += count
+        for size, count in state["session_participants"].items():
+            self.session_participants[int(size)] += count
+        if ended:
+            for session in (state["opening"], state["current"]):
+                if session is not None:
+                    self.session_messages[session[2]] += 1
+                    self.session_participants[len(session[3])] += 1
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import sqlite3
+from contextlib import closing
+from datetime import date as date_type
+
+STATS_DB_PATH = 'whatsapp_stat/files/history_stat.sqlite'
+LEGACY_HISTORY_PATH = 'whatsapp_stat/files/history_stat.json'
+STAT_NAMES = ('hour_dict', 'month_dict', 'year_dict', 'name_dict')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_name TEXT PRIMARY KEY,
+    snapshot_date TEXT NOT NULL,
+    message_count INTEGER,
+    stats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    chat_name TEXT NOT NULL,
+    snapshot_date TEXT NOT NULL,
+    message_count INTEGER,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (chat_name, snapshot_date)
+);
+"""
+
+
+class StatsStore:
+    """History of the statistics of every chat, kept in one SQLite database.
+
+    ``chats`` holds the latest snapshot of each chat keyed by its name, and ``snapshots`` one
+    snapshot per chat per day, so the history can be followed over time. Each save is a single
+    transaction that replaces that day's snapshot, so a save is atomic and several processes can
+    save different chats at the same time.
+
+    The stats are stored as plain JSON objects, unlike the old ``history_stat.json`` where every
+    dict was a JSON string inside the JSON. That file is imported when the database is created.
+    """
+    def __init__(self, path=STATS_DB_PATH, legacy_path=LEGACY_HISTORY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        created = not os.path.exists(path)
+        with closing(self._connect()) as connection:
+            connection.executescript(SCHEMA)
+        if created and legacy_path and os.path.exists(legacy_path):
+            self.migrate_json(legacy_path)
+
+    def _connect(self):
+        # Writers wait for each other instead of failing while another chat is being saved
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def save(self, chat_name, stats, message_count=None, snapshot_date=None):
+        """Store ``stats`` as the latest snapshot of ``chat_name`` and as its snapshot of the day."""
+        snapshot_date = (snapshot_date or date_type.today()).isoformat()
+        stats_json = json.dumps(stats, ensure_ascii=False)
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute(
+                    'INSERT INTO snapshots VALUES (?, ?, ?, ?) ON CONFLICT (chat_name, snapshot_date) '
+                    'DO UPDATE SET message_count = excluded.message_count, stats = excluded.stats',
+                    (chat_name, snapshot_date, message_count, stats_json))
+                # An older snapshot never replaces a newer one, which matters for migrations
+                connection.execute(
+                    'INSERT INTO chats VALUES (?, ?, ?, ?) ON CONFLICT (chat_name) DO UPDATE SET '
+                    'snapshot_date = excluded.snapshot_date, message_count = excluded.message_count, stats = excluded.stats '
+                    'WHERE excluded.snapshot_date >= chats.snapshot_date',
+                    (chat_name, snapshot_date, message_count, stats_json))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def load(self, chat_name):
+        """Return the latest stats of ``chat_name``, or ``None`` if it was never saved."""
+        with closing(self._connect()) as connection:
+            row = connection.execute('SELECT stats FROM chats WHERE chat_name = ?', (chat_name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def history(self, chat_name):
+        """Return ``(date, message_count, stats)`` for every snapshot of ``chat_name``, oldest first."""
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT snapshot_date, message_count, stats FROM snapshots WHERE chat_name = ? '
+                                      'ORDER BY snapshot_date', (chat_name,)).fetchall()
+        return [(date_type.fromisoformat(day), message_count, json.loads(stats)) for day, message_count, stats in rows]
+
+    def chat_names(self):
+        with closing(self._connect()) as connection:
+            return [name for name, in connection.execute('SELECT chat_name FROM chats ORDER BY chat_name')]
+
+    def migrate_json(self, legacy_path=LEGACY_HISTORY_PATH):
+        """Import the chats of the old ``history_stat.json``, dated by the file's modification day."""
+        with open(legacy_path, 'r', encoding='utf-8') as file:
+            legacy = json.load(file)
+        snapshot_date = date_type.fromtimestamp(os.path.getmtime(legacy_path))
+        for chat_name, data in legacy.items():
+            stats = {name: json.loads(value) if isinstance(value, str) else value for name, value in data.items()}
+            message_count = sum(stats['name_dict'].values()) if 'name_dict' in stats else None
+            self.save(chat_name, stats, message_count, snapshot_date)
+        print(f"Imported {len(legacy)} chats from {legacy_path} into {self.path}")
+        return len(legacy)
+
+
+if __name__ == '__main__':
+    # Import an old history file by hand: python stats_store.py [history_stat.json]
+    StatsStore(legacy_path=None).migrate_json(sys.argv[1] if len(sys.argv) > 1 else LEGACY_HISTORY_PATH)
@@ -0,0 +1,83 @@
+import random
+import argparse
+from datetime import datetime, timedelta
+
+HEBREW_WORDS = ['שלום', 'מה', 'קורה', 'טוב', 'לא', 'כן', 'אני', 'אתה', 'זה', 'את', 'של', 'על', 'יש', 'אין', 'עם',
+                'אבל', 'גם', 'רק', 'היה', 'אם', 'איזה', 'אחי', 'תודה', 'אוהב', 'יופי', 'בסדר', 'מחר', 'היום', 'עכשיו',
+                'בית', 'אוכל', 'ערב', 'בוקר', 'לילה', 'שבת', 'חג', 'סבבה', 'אחלה', 'נו', 'וואלה', 'באמת', 'מתי', 'איפה',
+                'למה', 'כמה', 'הכל', 'משהו', 'מישהו', 'תמונה', 'סרט', 'משחק', 'עבודה', 'לימודים', 'ים', 'נסיעה']
+ENGLISH_WORDS = ['ok', 'lol', 'yes', 'no', 'thanks', 'hello', 'game', 'tonight', 'party', 'link', 'video', 'photo',
+                 'good', 'morning', 'love', 'see', 'you', 'soon', 'what', 'when', 'where', 'why', 'nice', 'cool']
+HEBREW_LETTERS = 'אבגדהוזחטיכלמנסעפצקרשת'
+FIRST_NAMES = ['אופק', 'בגדי', 'זקי', 'שולץ', 'בכר', 'נדלר', 'אלעזר', 'בנדור', 'לדאני', 'דולב', 'בטיטו', 'אבא', 'אמא',
+               'רני', 'שקד', 'זוהר', 'עז', 'שחר', 'אופיר']
+MEDIA_LINE = '<המדיה לא נכללה>'
+
+
+def _sender_names(count, rng):
+    names = FIRST_NAMES[:count]
+    while len(names) < count:
+        names.append(f"+972 5{rng.randint(0, 9)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}")
+    return names
+
+
+def _vocabulary(size, rng):
+    """Common Hebrew and English words followed by a long tail of made up Hebrew words."""
+    words = HEBREW_WORDS + ENGLISH_WORDS
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(HEBREW_LETTERS) for _ in range(rng.randint(2, 7)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def generate_chat(path, messages=10_000, senders=8, vocabulary_size=20_000, multiline_ratio=0.05, media_ratio=0.04,
+                  system_ratio=0.001, start=datetime(2015, 1, 1), seed=0):
+    """Write a WhatsApp export with ``messages`` messages in the format ``ChatStats`` parses.
+
+    Words follow a Zipf distribution over a mixed Hebrew and English vocabulary. Some messages
+    span several lines, some are media placeholders and a few system lines are mixed in.
+    The file is written as it is generated, so any size fits in memory.
+    """
+    rng = random.Random(seed)
+    names = _sender_names(senders, rng)
+    sender_weights = [1 / (rank + 1) for rank in range(senders)]
+    words = _vocabulary(vocabulary_size, rng)
+    cumulative_weights = []
+    total = 0
+    for rank in range(len(words)):
+        total += 1 / (rank + 1)
+        cumulative_weights.append(total)
+
+    timestamp = start
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f"{start.day}.{start.month}.{start.year}, 0:00 - ההודעות והשיחות מוצפנות מקצה לקצה.\n")
+        for _ in range(messages):
+            timestamp += timedelta(minutes=int(rng.expovariate(1 / 20)))
+            prefix = f"{timestamp.day}.{timestamp.month}.{timestamp.year}, {timestamp.hour}:{timestamp.minute:02d} - "
+            person = rng.choices(names, sender_weights)[0]
+            if rng.random() < system_ratio:
+                file.write(f"{prefix}{person} הצטרף/ה באמצעות קישור ההזמנה של הקבוצה\n")
+            if rng.random() < media_ratio:
+                text = MEDIA_LINE
+            else:
+                text = ' '.join(rng.choices(words, cum_weights=cumulative_weights, k=rng.randint(1, 15)))
+                if rng.random() < 0.2:
+                    text += rng.choice(['!', '?', '...', ' 😂', ' 123'])
+            file.write(f"{prefix}{person}: {text}\n")
+            if rng.random() < multiline_ratio:
+                for _ in range(rng.randint(1, 6)):
+                    file.write(' '.join(rng.choices(words, cum_weights=cumulative_weights, k=rng.randint(1, 12))) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic WhatsApp chat export.")
+    parser.add_argument('path')
+    parser.add_argument('--messages', type=int, default=10_000)
+    parser.add_argument('--senders', type=int, default=8)
+    parser.add_argument('--vocabulary', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_chat(args.path, messages=args.messages, senders=args.senders, vocabulary_size=args.vocabulary, seed=args.seed)
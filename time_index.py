@@ -0,0 +1,80 @@
+from datetime import date as date_type, datetime
+
+import numpy as np
+
+from message_table import EPOCH_ORDINAL, MINUTES_PER_DAY
+
+
+def to_minutes(value, end=False):
+    """Turn a ``date``, ``datetime`` or ``None`` bound into minutes since the epoch.
+
+    A ``date`` covers its whole day, so as an ``end`` it means the midnight after it.
+    """
+    if value is None:
+        return np.iinfo(np.int64).max if end else np.iinfo(np.int64).min
+    if isinstance(value, datetime):
+        return (value.toordinal() - EPOCH_ORDINAL) * MINUTES_PER_DAY + value.hour * 60 + value.minute
+    return (value.toordinal() - EPOCH_ORDINAL + (1 if end else 0)) * MINUTES_PER_DAY
+
+
+class TimeIndex:
+    """Sorted timestamp index over the rows of a ``MessageTable``.
+
+    The rows are kept in time order, with the first row of every day and the running total of
+    messages per day, person and hour. Finding the rows of a time range is a binary search, and
+    the counts of all the whole days inside it are the difference of two running totals; only
+    the rows of the two days at the edges of the range are counted one by one.
+    """
+    def __init__(self, table):
+        minutes = table.minutes
+        self.order = np.argsort(minutes, kind='stable')
+        self.minutes = minutes[self.order]
+        self.person_codes = table.person_codes[self.order]
+        self.persons = list(table.persons)
+        days = self.minutes // MINUTES_PER_DAY
+        self.days, first_rows = np.unique(days, return_index=True)
+        self.day_rows = np.append(first_rows, len(self.minutes))
+        grid = self._grid(np.repeat(np.arange(len(self.days)), np.diff(self.day_rows)), self.person_codes,
+                          self.minutes // 60 % 24, len(self.days))
+        self.cumulative = np.concatenate([np.zeros((1, len(self.persons), 24), dtype=np.int64), grid.cumsum(axis=0)])
+        self.person_minutes = [self.minutes[self.person_codes == code] for code in range(len(self.persons))]
+
+    def _grid(self, day_positions, person_codes, hours, day_count):
+        """Count messages into a ``(day, person, hour)`` grid."""
+        flat = (day_positions * len(self.persons) + person_codes) * 24 + hours
+        return np.bincount(flat, minlength=day_count * len(self.persons) * 24).reshape(day_count, len(self.persons), 24)
+
+    def rows(self, start=None, end=None):
+        """Return the half open range of sorted rows with ``start <= timestamp < end``."""
+        first = np.searchsorted(self.minutes, to_minutes(start), 'left')
+        last = np.searchsorted(self.minutes, to_minutes(end, end=True), 'left')
+        return int(first), int(max(first, last))
+
+    def count(self, start=None, end=None, persons=None):
+        """Number of messages in the range, sent by any of ``persons`` if given."""
+        if persons is None:
+            first, last = self.rows(start, end)
+            return last - first
+        low, high = to_minutes(start), to_minutes(end, end=True)
+        return sum(int(np.searchsorted(self.person_minutes[code], high) - np.searchsorted(self.person_minutes[code], low))
+                   for code, person in enumerate(self.persons) if person in persons)
+
+    def day_grid(self, first, last):
+        """Return the days of the sorted rows ``first:last`` and their ``(day, person, hour)`` message counts."""
+        if first >= last:
+            return self.days[:0], np.zeros((0, len(self.persons), 24), dtype=np.int64)
+        first_day = int(np.searchsorted(self.day_rows, first, 'right')) - 1
+        last_day = int(np.searchsorted(self.day_rows, last - 1, 'right')) - 1
+        days = self.days[first_day:last_day + 1]
+        # Whole days come from the running totals, the partial days at the edges from their rows
+        grid = np.diff(self.cumulative[first_day:last_day + 2], axis=0)
+        for day, day_first, day_last in ((first_day, first, self.day_rows[first_day + 1]), (last_day, self.day_rows[last_day], last)):
+            if day_first != self.day_rows[day] or day_last != self.day_rows[day + 1]:
+                rows = slice(max(day_first, first), min(day_last, last))
+                grid[day - first_day] = self._grid(np.zeros(rows.stop - rows.start, dtype=np.int64), self.person_codes[rows],
+                                                   self.minutes[rows] // 60 % 24, 1)[0]
+        return days, grid
+
+    @staticmethod
+    def day_to_date(day):
+        return date_type.fromordinal(int(day) + EPOCH_ORDINAL)
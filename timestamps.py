@@ -0,0 +1,106 @@
+import re
+from datetime import date as date_type, time as time_type
+
+import numpy as np
+
+# Date part of the message line, the separator between its fields and the order of the fields
+LOCALES = {
+    # 31.12.2023, 21:05 - the format of our exports
+    'dotted': (r'\d{1,2}\.\d{1,2}\.\d{4}', '.', 'dmy'),
+    # 31/12/23, 21:05 or 31/12/2023, 9:05 PM
+    'slashed': (r'\d{1,2}/\d{1,2}/\d{2,4}', '/', 'dmy'),
+    # 12/31/23, 9:05 PM
+    'us': (r'\d{1,2}/\d{1,2}/\d{2,4}', '/', 'mdy'),
+}
+TIME_PATTERN = r'\d{1,2}:\d{2}(?:[ \u202f]?[AaPp]\.?[Mm]\.?)?'
+# The same over UTF-8 bytes, where the narrow no-break space before AM/PM is three bytes long
+TIME_PATTERN_BYTES = rb'\d{1,2}:\d{2}(?:(?: |\xe2\x80\xaf)?[AaPp]\.?[Mm]\.?)?'
+EPOCH_ORDINAL = date_type(1970, 1, 1).toordinal()
+
+
+def message_pattern(locale='dotted'):
+    """Return the compiled pattern of a message line in the given export locale."""
+    return re.compile(rf'(?P<date>{LOCALES[locale][0]}), (?P<time>{TIME_PATTERN}) - (?P<person>.*?): (?P<message>.*)')
+
+
+def line_pattern(locale='dotted'):
+    """Return the compiled pattern of the lines that start with a date and time, over raw UTF-8 bytes.
+
+    The pattern is anchored at the start of every line, so ``finditer`` over a whole buffer steps
+    over continuation lines inside the regex engine, which gives up on a line at its first
+    character unless it is a digit. Message lines fill the ``person`` and ``message`` groups.
+    System lines have no ``sender: `` part and fill the ``event`` group instead; these are joins,
+    subject changes and the encryption notice.
+    """
+    date_pattern = LOCALES[locale][0].encode('ascii')
+    return re.compile(rb'^(?P<date>' + date_pattern + rb'), (?P<time>' + TIME_PATTERN_BYTES + rb') - '
+                      rb'(?:(?P<person>.*?): (?P<message>.*)|(?P<event>.*))', re.MULTILINE)
+
+
+def detect_locale(filepath, sample_lines=2000):
+    """Guess the export locale of a chat file from its first lines."""
+    patterns = {locale: message_pattern(locale) for locale in ('dotted', 'slashed')}
+    matches = {locale: [] for locale in patterns}
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as file:
+        for _, line in zip(range(sample_lines), file):
+            for locale, pattern in patterns.items():
+                match = pattern.match(line)
+                if match:
+                    matches[locale].append(match.group('date'))
+    if len(matches['slashed']) > len(matches['dotted']):
+        fields = [date_str.split('/') for date_str in matches['slashed']]
+        # Day first unless the second field is sometimes too large to be a month
+        if any(int(second) > 12 for _, second, _ in fields) and not any(int(first) > 12 for first, _, _ in fields):
+            return 'us'
+        return 'slashed'
+    return 'dotted'
+
+
+class TimestampDecoder:
+    """Turns the date and time strings of message lines into ``date`` and ``time`` objects.
+
+    The fields are read straight from the strings with ``int`` instead of going through
+    ``datetime.strptime``, and every distinct string is decoded only once, since thousands
+    of messages share the same day.
+    """
+    def __init__(self, locale='dotted'):
+        self.locale = locale
+        _, self.separator, self.order = LOCALES[locale]
+        self._dates = {}
+        self._times = {}
+
+    def date(self, date_str):
+        date = self._dates.get(date_str)
+        if date is None:
+            first, second, year_str = date_str.split(self.separator)
+            day, month = (int(first), int(second)) if self.order == 'dmy' else (int(second), int(first))
+            year = int(year_str)
+            if len(year_str) == 2:
+                # Same pivot as strptime's %y
+                year += 2000 if year < 69 else 1900
+            date = self._dates[date_str] = date_type(year, month, day)
+        return date
+
+    def time(self, time_str):
+        time = self._times.get(time_str)
+        if time is None:
+            hour_str, rest = time_str.split(':', 1)
+            hour, minute = int(hour_str), int(rest[:2])
+            suffix = rest[2:].strip(' \u202f').replace('.', '').lower()
+            if suffix:
+                if not 1 <= hour <= 12:
+                    raise ValueError(f"hour {hour} is not valid with {suffix}")
+                hour = hour % 12 + (12 if suffix == 'pm' else 0)
+            time = self._times[time_str] = time_type(hour, minute)
+        return time
+
+    def decode_many(self, date_strs, time_strs):
+        """Decode whole columns of date and time strings at once into ``datetime64[m]`` values.
+
+        Only the distinct strings are decoded, the rest is done with array indexing.
+        """
+        unique_dates, date_index = np.unique(np.asarray(date_strs), return_inverse=True)
+        unique_times, time_index = np.unique(np.asarray(time_strs), return_inverse=True)
+        days = np.array([self.date(date_str).toordinal() - EPOCH_ORDINAL for date_str in unique_dates], dtype=np.int64)
+        minutes = np.array([self.time(time_str).hour * 60 + self.time(time_str).minute for time_str in unique_times], dtype=np.int64)
+        return (days[date_index] * 24 * 60 + minutes[time_index]).astype('datetime64[m]')
@@ -0,0 +1,60 @@
+import re
+import unicodedata
+
+# Words too common to tell anything in the word counts
+WITHOUT_WORDS =['לא', 'מה', 'מדיה', 'זה', 'את', 'של', 'על', 'יש', 'אתה', 'עם', 'אני', 'אין', 'הוא', 'אבל', 'איזה', 'גם', 'כל', 'לי', 'רק', 'היה', 'אם', 'טוב', 'חייב', 'כן']
+# Hebrew points and cantillation marks, invisible direction and joiner marks, and the apostrophes,
+# gereshim and quotes that are dropped inside words, so צ'יפס and צה"ל stay one word
+DROPPED_PATTERN = re.compile('[\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7\u05f3\u05f4\u200b-\u200f\u202a-\u202e\u2066-\u2069\'"\u2019]')
+# A word is a run of two or more letters, anything else between letters splits words
+WORD_PATTERN = re.compile(r'[^\W\d_]{2,}')
+# Joins the texts tokenized in one batch, normalization leaves it as is
+SEPARATOR = '\0'
+FINAL_LETTERS = {'ך': 'כ', 'ם': 'מ', 'ן': 'נ', 'ף': 'פ', 'ץ': 'צ'}
+
+
+class Tokenizer:
+    """Splits message text into the words that are counted.
+
+    The text is put in the Unicode ``form`` first, so look-alike characters count as one, and
+    Hebrew points, invisible marks and apostrophes are dropped. With ``final_letters=True`` the
+    final forms of ךםןףץ are also written as the regular letters. All of this runs over a whole
+    text with regular expressions and string methods, never a Python call per character.
+
+    ``stop_words`` are left out of the single word counts and the word rankings. The phrases and
+    lexicons still see them.
+    """
+    def __init__(self, stop_words=WITHOUT_WORDS, final_letters=False, form='NFKC'):
+        self.final_letters = final_letters
+        self.form = form
+        self.stop_words = frozenset(self.normalize(word) for word in stop_words)
+
+    def normalize(self, text):
+        if self.form:
+            text = unicodedata.normalize(self.form, text)
+        text = DROPPED_PATTERN.sub('', text)
+        if self.final_letters:
+            for final, regular in FINAL_LETTERS.items():
+                text = text.replace(final, regular)
+        return text
+
+    def tokenize(self, text):
+        """Return the words of one text, in order."""
+        return WORD_PATTERN.findall(self.normalize(text))
+
+    def tokenize_many(self, texts):
+        """Return the words of each of many texts.
+
+        The texts are normalized as one string, which is much cheaper than one at a time for
+        short chat messages.
+        """
+        parts = self.normalize(SEPARATOR.join(texts)).split(SEPARATOR)
+        if len(parts) != len(texts):
+            # A text had the separator in it
+            return [self.tokenize(text) for text in texts]
+        findall = WORD_PATTERN.findall
+        return [findall(part) for part in parts]
+
+    def signature(self):
+        """The settings that change the counts, to tell whether saved counts were made with the same ones."""
+        return [sorted(self.stop_words), self.final_letters, self.form]